@@ -1,25 +1,31 @@
-import random
 import matplotlib.pyplot as plt
-import numpy as np
+from quantile_sketch import qq_points, sketch
+from sampler_validation import format_result, inverse_transform, numpy_exponential, sample_chunks, validate_sampler
 
 lambda_value = 0.5  # Intensity (arrival rate)
-num_samples = 1000 
+num_samples = 10**7  # Streamed in chunks, only a quantile sketch of each sampler is kept
+num_quantiles = 200  # Points of the Q-Q plot
+num_validation_samples = 10**8  # Samples for the streaming goodness-of-fit check, generated in chunks
 
-#random.expovariate gives us random pulls from the n.e.d 
-x_samples = [(-(1/lambda_value)*np.log(random.uniform(0,1))) for sumthing_sumthing in range (num_samples)]
-y_samples = [random.expovariate(lambda_value) for sumthin in range(num_samples)]
+#Inverse transform -(1/lambda)*log(U) against the library sampler (numpy's, like random.expovariate) pulling from the n.e.d
+#The sketches' compactions are seeded too (apart from the samples), so the plot and correlation are reproducible
+x_sketch = sketch(sample_chunks(inverse_transform, lambda_value, num_samples, seed=1), seed=3)
+y_sketch = sketch(sample_chunks(numpy_exponential, lambda_value, num_samples, seed=2), seed=4)
 
-x_sorted = sorted(x_samples)
-y_sorted = sorted(y_samples)
+#Q-Q curve from a fixed number of quantiles instead of sorting both samples in full
+x_quantiles, y_quantiles, correlation = qq_points(x_sketch, y_sketch, num_quantiles)
 
 #Some fancy statistics to look at the correlation 
-correlation = np.corrcoef(x_sorted, y_sorted)[0, 1]
 print(f"Correlation: {correlation}")
 
+#Goodness of fit of both samplers against the exponential on a much larger stream (KS, moments, chi-square)
+for sampler in (inverse_transform, numpy_exponential):
+    print(format_result(sampler.__name__, validate_sampler(sampler, lambda_value, num_validation_samples, seed=2024)))
+
 plt.figure(figsize=(10, 6))
-plt.plot(x_sorted, y_sorted, marker='o', linestyle='-', color='b', markersize=3, alpha=0.6)
-plt.xlabel('X samples')
-plt.ylabel('Y samples')
+plt.plot(x_quantiles, y_quantiles, marker='o', linestyle='-', color='b', markersize=3, alpha=0.6)
+plt.xlabel('X quantiles')
+plt.ylabel('Y quantiles')
 plt.title('Plot for X against Y')
 plt.grid(True)
 plt.show()
\ No newline at end of file
@@ -1,195 +1,210 @@
-import simpy
+import os
 import numpy as np
 import random
 import matplotlib.pyplot as plt
+from event_engine import make_environment
+from event_trace import STOPS, PASSENGERS, PASSENGER_ARRIVED, BUS_ARRIVED, PASSENGERS_LEFT, PASSENGERS_BOARDED, BUS_OCCUPANCY, ROUTE_SWITCH, NO_ROUTE
+from lazy_arrivals import ArrivalStream, LazyStopQueue
+from lockstep_engine import LockstepCountingModel
+from network import NETWORKS_DIR, load_network
+from route_demand import RouteDemand
+from running_stats import RunningStats, TimeWeightedStats
+from stop_queue import RingBuffer
 
 # Parameters
 CAPACITY = 20  # Capacity of the bus from Table 3
 PROB_LEAVE = 0.3  # Probability a passenger leaves at a bus stop
 SIMULATION_TIME = 100  # Total simulation time
 
-# Passenger arrival rates from Table 2
-ARRIVAL_RATES = {
-    "S1_e": 0.3, "S1_w": 0.6,
-    "S2_e": 0.1, "S2_w": 0.1,
-    "S3_e": 0.3, "S3_w": 0.9,
-    "S4_e": 0.2, "S4_w": 0.5,
-    "S5_e": 0.6, "S5_w": 0.4,
-    "S6_e": 0.6, "S6_w": 0.4,
-    "S7_e": 0.6, "S7_w": 0.4
-}
-
-# Travel times from Table 1 (in minutes)
-TRAVEL_TIMES = {
-    "R1": 3, "R2": 7, "R3": 6,
-    "R4": 1, "R5": 4, "R6": 3,
-    "R7": 9, "R8": 1, "R9": 3,
-    "R10": 8, "R11": 8, "R12": 5,
-    "R13": 6, "R14": 2, "R15": 3
-}
-
-#Routes from Lab 1
-routes = {
-    "Route_E1_E3_east": {
-        "start": "E1",
-        "end": "E3",
-        "stops": ["S1_e", "S4_e", "S6_e"],
-        "roads": ["R1", "R5", "R8", "R13"]
-    },
-    "Route_E1_E3_west": {
-        "start": "E3",
-        "end": "E1",
-        "stops": ["S6_w", "S4_w", "S1_w"],
-        "roads": ["R13", "R8", "R5", "R1"]
-    },
-    "Route_E1_E4_east": {
-        "start": "E1",
-        "end": "E4",
-        "stops": ["S2_e", "S5_e", "S7_e"],
-        "roads": ["R2", "R7", "R11", "R15"]
-    },
-    "Route_E1_E4_west": {
-        "start": "E4",
-        "end": "E1",
-        "stops": ["S7_w", "S5_w", "S2_w"],
-        "roads": ["R15", "R11", "R7", "R2"]
-    },
-    "Route_E2_E3_east": {
-        "start": "E2",
-        "end": "E3",
-        "stops": ["S3_e", "S7_e"],
-        "roads": ["R4", "R12", "R14"]
-    },
-    "Route_E2_E3_west": {
-        "start": "E3",
-        "end": "E2",
-        "stops": ["S7_w", "S3_w"],
-        "roads": ["R14", "R12", "R4"]
-    },
-    "Route_E2_E4_east": {
-        "start": "E2",
-        "end": "E4",
-        "stops": ["S3_e", "S7_e"],
-        "roads": ["R4", "R12", "R15"]
-    },
-    "Route_E2_E4_west": {
-        "start": "E4",
-        "end": "E2",
-        "stops": ["S7_w", "S3_w"],
-        "roads": ["R15", "R12", "R4"]
-    }
-}
+# Network from Lab 1 (arrival rates from Table 2, travel times, routes), compiled to integer ids
+# The model runs on stop, route and terminal ids; names are only used to load the network and in traces
+NETWORK = load_network(os.path.join(NETWORKS_DIR, "lab1.json"))
+ROUTE_TABLE = NETWORK.route_table()
 
-#Passenger generator entity
-def passenger_generator(env, bus_stop_queues):
-    for stop in bus_stop_queues.keys():
-        env.process(generate_passengers_at_stop(env, bus_stop_queues, stop))
+# Terminal id -> ids of the routes starting there
+ROUTES_FROM = NETWORK.routes_from
 
-#Helper function to generate passengers at a specific bus stop
-def generate_passengers_at_stop(env, bus_stop_queues, stop):
+#Passenger generator entity
+def passenger_generator(env, bus_stop_queues, tracer=None, profiler=None):
+    for stop in range(len(bus_stop_queues)):
+        env.process(generate_passengers_at_stop(env, bus_stop_queues, stop, tracer, profiler))
+
+#Helper function to generate passengers at a specific bus stop (an id)
+def generate_passengers_at_stop(env, bus_stop_queues, stop, tracer=None, profiler=None):
+    trace_passengers = tracer is not None and tracer.enabled(PASSENGERS)
+    arrival_rate = NETWORK.arrival_rates[stop]
     while True:
-        interarrival_time = random.expovariate(ARRIVAL_RATES[stop])
+        interarrival_time = random.expovariate(arrival_rate)
         yield env.timeout(interarrival_time)
 
+        if profiler is not None:
+            profiler.event("passenger_generator")
+            started = profiler.clock()
+
         #Record arrival time of passenger
         arrival_time = env.now
         bus_stop_queues[stop].append(arrival_time)
-        print(f"Passenger arrived at {stop} at time {env.now}")
-
-#Bus entity
-def bus(env, bus_stop_queues, initial_route_name, utilization_record):
+        if trace_passengers:
+            tracer.emit(PASSENGER_ARRIVED, env.now, tracer.name_id(NETWORK.stop_names[stop]), -1)
+
+        if profiler is not None:
+            profiler.queue_length(stop, len(bus_stop_queues[stop]))
+            profiler.phase("arrival", started)
+
+#Lazy arrival mode: no SimPy process per stop, arrival times are drawn in blocks
+#and only become queue entries when a bus (or the route switching) looks at the stop
+#Traced arrivals are therefore written when they are materialized, stamped with their own arrival time
+def lazy_bus_stop_queues(env, stops, rng, demand, tracer=None):
+    trace_passengers = tracer is not None and tracer.enabled(PASSENGERS)
+    bus_stop_queues = []
+    for stop in stops:
+        record_arrivals = None  #untraced arrival times go straight into the ring buffer
+        if trace_passengers:
+            def record_arrivals(arrival_times, stop_id=tracer.name_id(NETWORK.stop_names[stop])):
+                for arrival_time in arrival_times.tolist():
+                    tracer.emit(PASSENGER_ARRIVED, arrival_time, stop_id, -1)
+                return arrival_times
+
+        bus_stop_queues.append(LazyStopQueue(env, ArrivalStream(NETWORK.arrival_rates[stop], rng), RingBuffer(stop, demand), record_arrivals))
+        demand.watch_lazy(stop, bus_stop_queues[stop])
+    return bus_stop_queues
+
+#Bus entity, starting on route initial_route (an id)
+def bus(env, bus_stop_queues, initial_route, utilization_stats, occupancy, rng, demand, tracer=None, profiler=None):
+    trace_stops = tracer is not None and tracer.enabled(STOPS)
     occ = 0
-    current_route_name = initial_route_name
-    current_route = routes[current_route_name]
+    recorded_occ = 0  #occupancy last reported to the fleet-wide occupancy integral
+    current_route = initial_route
 
     while True:
-        route_stops = current_route["stops"]
-        route_roads = current_route["roads"]
+        route_stops = NETWORK.stops_of[current_route]
+        leg_times = NETWORK.leg_times_of[current_route]
 
-        for i in range(len(route_roads)):
+        for i in range(len(leg_times)):
             #Travel time for the road segment leading up to the next stop
-            travel_time = TRAVEL_TIMES[route_roads[i]]
+            travel_time = leg_times[i]
             yield env.timeout(travel_time)
+
+            if profiler is not None:
+                profiler.event("bus")
+                started = profiler.clock()
             
             if i < len(route_stops):
                 stop = route_stops[i]
-                print(f"Bus arriving at {stop} at time {env.now}")
+                if trace_stops:
+                    tracer.emit(BUS_ARRIVED, env.now, tracer.name_id(NETWORK.stop_names[stop]))
 
                 #Drop off passengers
                 if occ > 0:
-                    num_leaving = sum([1 for _ in range(occ) if random.uniform(0, 1) <= PROB_LEAVE])
+                    num_leaving = rng.binomial(occ, PROB_LEAVE)  #same distribution as one uniform draw per passenger
                     occ -= num_leaving
-                    print(f"{num_leaving} passengers left the bus at {stop} at time {env.now}")
+                    if trace_stops:
+                        tracer.emit(PASSENGERS_LEFT, env.now, tracer.name_id(NETWORK.stop_names[stop]), num_leaving)
+
+                if profiler is not None:
+                    started = profiler.phase("alighting", started)
 
                 #Pick up passengers
                 num_waiting = len(bus_stop_queues[stop])
                 num_boarding = min(num_waiting, CAPACITY - occ)
-                for _ in range(num_boarding):
-                    bus_stop_queues[stop].pop(0) #doesn't really matter which to pop, the activity diagram doesn't say anything else than just to remove them. 
+                bus_stop_queues[stop].take(num_boarding) #doesn't really matter which to remove, the activity diagram doesn't say anything else than just to remove them. 
 
                 occ += num_boarding
-                print(f"{num_boarding} passengers boarded the bus at {stop} at time {env.now}")
-                print(f"Bus capacity now: {occ}/{CAPACITY}")
+                if trace_stops:
+                    tracer.emit(PASSENGERS_BOARDED, env.now, tracer.name_id(NETWORK.stop_names[stop]), num_boarding)
+                    tracer.emit(BUS_OCCUPANCY, env.now, occ, CAPACITY)
 
                 #Record utilization after completing the route
                 utilization = occ / CAPACITY  #Calculate utilization as current capacity divided by max capacity
-                utilization_record.append(utilization)
+                utilization_stats.add(utilization)
+                occupancy.change(env.now, occ - recorded_occ)
+                recorded_occ = occ
+                if profiler is not None:
+                    profiler.queue_length(stop, num_waiting)
+                    profiler.phase("boarding", started)
 
         
         """"""""""""""""""""""
         Route switching logic 
         """""""""""""""""""""""
         # Determine the next route dynamically based on the current route's end
-        current_end = current_route["end"]
-        most_waiting = 0
-        next_route_name = None
-
-        # Find all possible routes that start from the current end stop
-        possible_routes = [
-            route_name for route_name, route_data in routes.items() if route_data["start"] == current_end
-        ]
-
-        # Iterate over all possible routes and find the one with the most passengers waiting at all stops
-        for route_name in possible_routes:
-            total_waiting = sum(len(bus_stop_queues[stop]) for stop in routes[route_name]["stops"])  #Calculate total waiting passengers at all stops on the route
-            
-            if total_waiting > most_waiting:
-                most_waiting = total_waiting
-                next_route_name = route_name
+        if profiler is not None:
+            started = profiler.clock()
+        current_end = NETWORK.end_of[current_route]
+        # Routes starting from the current end stop, from the index built once at start-up
+        possible_routes = ROUTES_FROM.get(current_end, [])
+
+        # Pick the one with the most passengers waiting at all its stops (totals are kept up to date by the stop queues)
+        next_route = demand.busiest(possible_routes)
 
         # Update the current route to the one with the most waiting passengers
-        if next_route_name:
-            current_route_name = next_route_name
-            current_route = routes[current_route_name]
-            print(f"Bus switching to a new route: {current_route_name} at time {env.now}")
-        else:
-            print(f"No connecting route found from {current_end}. Continuing with the current route.")
+        if next_route is not None:
+            current_route = next_route
+            if trace_stops:
+                tracer.emit(ROUTE_SWITCH, env.now, tracer.name_id(NETWORK.route_names[current_route]))
+        elif trace_stops:
+            tracer.emit(NO_ROUTE, env.now, tracer.name_id(NETWORK.terminal_names[current_end]))
+        if profiler is not None:
+            profiler.phase("route_switch", started)
 
 
 
 # Running the simulation function
-def run_simulation(nb_values, num_runs):
+#arrivals="process" runs one passenger process per stop, arrivals="lazy" uses lazy_bus_stop_queues
+#engine="heapq" runs the model on event_engine.Environment instead of SimPy, engine="lockstep" runs the
+#num_runs replications of each n_b together on lockstep_engine.LockstepCountingModel (arrivals does not apply)
+#tracer is an optional event_trace.Tracer that records the events of every run (not with engine="lockstep")
+#utilization="visits" averages occ/CAPACITY over stop visits, "time" is the time-weighted fleet utilization
+#profiler is an optional profiler.Profiler timing the phases of the buses and passenger generators of every run
+#(not with engine="lockstep"). The runs share the global random module, so they always run in this process.
+def run_simulation(nb_values, num_runs, arrivals="process", engine="simpy", tracer=None, utilization="visits", profiler=None):
     average_utilizations = []
     standard_errors = []
+    if engine == "lockstep":
+        if tracer is not None:
+            raise ValueError("The lockstep engine cannot trace events")
+        if profiler is not None:
+            raise ValueError("The lockstep engine has no processes to profile")
+        lockstep_model = LockstepCountingModel(NETWORK, CAPACITY, PROB_LEAVE)
 
     for n_b in nb_values:
         utilization_records = []
 
-        for run in range(num_runs):
-            env = simpy.Environment()
-            bus_stop_queues = {stop: [] for route in routes.values() for stop in route["stops"]}
-
-            passenger_generator(env, bus_stop_queues)
-
-            # Start multiple buses
-            utilization_record = []
-            for i in range(n_b):
-                route_name = random.choice(list(routes.keys()))  # Get a random route
-                env.process(bus(env, bus_stop_queues, route_name, utilization_record))
-
-            # Run simulation
-            env.run(until=SIMULATION_TIME)
-            utilization_records.append(np.mean(utilization_record))
+        if engine == "lockstep":
+            rng = np.random.default_rng(random.getrandbits(64))  #seeded from random so random.seed still fixes the run
+            visit_utilizations, mean_occupancies = lockstep_model.run(n_b, num_runs, SIMULATION_TIME, rng)
+            if utilization == "time":
+                utilization_records = list(mean_occupancies / (n_b * CAPACITY))
+            else:
+                utilization_records = list(visit_utilizations)
+        else:
+            for run in range(num_runs):
+                env = make_environment(engine)
+                rng = np.random.default_rng(random.getrandbits(64))  #seeded from random so random.seed still fixes the run
+                demand = RouteDemand(ROUTE_TABLE)
+                bus_stop_queues = [RingBuffer(stop, demand) for stop in range(NETWORK.num_stops)]
+
+                if arrivals == "lazy":
+                    bus_stop_queues = lazy_bus_stop_queues(env, range(NETWORK.num_stops), rng, demand, tracer)
+                else:
+                    passenger_generator(env, bus_stop_queues, tracer, profiler)
+
+                # Start multiple buses
+                utilization_stats = RunningStats()
+                occupancy = TimeWeightedStats()
+                for i in range(n_b):
+                    route = random.choice(range(NETWORK.num_routes))  # Get a random route
+                    env.process(bus(env, bus_stop_queues, route, utilization_stats, occupancy, rng, demand, tracer, profiler))
+
+                # Run simulation
+                if profiler is None:
+                    env.run(until=SIMULATION_TIME)
+                else:
+                    profiler.run(env, until=SIMULATION_TIME)
+                if utilization == "time":
+                    utilization_records.append(occupancy.mean(SIMULATION_TIME) / (n_b * CAPACITY))
+                else:
+                    utilization_records.append(utilization_stats.mean)
 
         avg_utilization = np.mean(utilization_records)
         std_error = np.std(utilization_records) / np.sqrt(num_runs)
@@ -199,16 +214,17 @@ def run_simulation(nb_values, num_runs):
 
     return average_utilizations, standard_errors
 
-#Run the simulation and plot results
-nb_values = [5, 7, 10, 15]
-num_runs = 15
-average_utilizations, standard_errors = run_simulation(nb_values, num_runs)
-
-plt.figure(figsize=(10, 6))
-plt.errorbar(nb_values, average_utilizations, yerr=standard_errors, fmt='o-', capsize=5, label='Average Utilization')
-plt.xlabel('Number of Buses ($n_b$)')
-plt.ylabel('Average Utilization')
-plt.title('Bus Utilization vs Number of Buses')
-plt.grid(True)
-plt.legend()
-plt.show()
\ No newline at end of file
+if __name__ == "__main__":
+    #Run the simulation and plot results
+    nb_values = [5, 7, 10, 15]
+    num_runs = 15
+    average_utilizations, standard_errors = run_simulation(nb_values, num_runs)
+
+    plt.figure(figsize=(10, 6))
+    plt.errorbar(nb_values, average_utilizations, yerr=standard_errors, fmt='o-', capsize=5, label='Average Utilization')
+    plt.xlabel('Number of Buses ($n_b$)')
+    plt.ylabel('Average Utilization')
+    plt.title('Bus Utilization vs Number of Buses')
+    plt.grid(True)
+    plt.legend()
+    plt.show()
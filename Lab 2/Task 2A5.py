@@ -1,217 +1,267 @@
-import simpy
+import os
 import numpy as np
-import random
+from functools import partial
 import matplotlib.pyplot as plt
+from destination_sampler import DestinationSampler
+from event_engine import make_environment
+from event_trace import STOPS, PASSENGERS, PASSENGER_ARRIVED, BUS_ARRIVED, PASSENGER_LEFT, PASSENGER_BOARDED, BUS_OCCUPANCY, ROUTE_SWITCH, NO_ROUTE
+from lazy_arrivals import ArrivalStream, LazyStopQueue
+from passenger_table import PassengerTable
+from profiler import profiled
+from network import NETWORKS_DIR, load_network
+from route_demand import RouteDemand
+from batch_means import BatchSeries, steady_state
+from running_stats import RunningStats, TimeWeightedStats
+from stop_queue import StopQueue
+from parallel_runner import replication_seeds, replication_tasks, run_replications
+from sequential_runner import run_sequential
 
 #Parameters
 CAPACITY = 20  #Capacity of the bus from Table 3
 SIMULATION_TIME = 100  #Increased total simulation time
 
-#Passenger arrival rates from Table 2
-ARRIVAL_RATES = {
-    "S1_e": 0.3, "S1_w": 0.6,
-    "S2_e": 0.1, "S2_w": 0.1,
-    "S3_e": 0.3, "S3_w": 0.9,
-    "S4_e": 0.2, "S4_w": 0.5,
-    "S5_e": 0.6, "S5_w": 0.4,
-    "S6_e": 0.6, "S6_w": 0.4,
-    "S7_e": 0.6, "S7_w": 0.4
-}
-
-#Travel times from Table 1 (in minutes)
-TRAVEL_TIMES = {
-    "R1": 3, "R2": 7, "R3": 6,
-    "R4": 1, "R5": 4, "R6": 3,
-    "R7": 9, "R8": 1, "R9": 3,
-    "R10": 8, "R11": 8, "R12": 5,
-    "R13": 6, "R14": 2, "R15": 3
-}
-
-#Routes from Lab 1
-routes = {
-    "Route_E1_E3_east": {
-        "start": "E1",
-        "end": "E3",
-        "stops": ["S1_e", "S4_e", "S6_e"],
-        "roads": ["R1", "R5", "R8", "R13"]
-    },
-    "Route_E1_E3_west": {
-        "start": "E3",
-        "end": "E1",
-        "stops": ["S6_w", "S4_w", "S1_w"],
-        "roads": ["R13", "R8", "R5", "R1"]
-    },
-    "Route_E1_E4_east": {
-        "start": "E1",
-        "end": "E4",
-        "stops": ["S2_e", "S5_e", "S7_e"],
-        "roads": ["R2", "R7", "R11", "R15"]
-    },
-    "Route_E1_E4_west": {
-        "start": "E4",
-        "end": "E1",
-        "stops": ["S7_w", "S5_w", "S2_w"],
-        "roads": ["R15", "R11", "R7", "R2"]
-    },
-    "Route_E2_E3_east": {
-        "start": "E2",
-        "end": "E3",
-        "stops": ["S3_e", "S7_e"],
-        "roads": ["R4", "R12", "R14"]
-    },
-    "Route_E2_E3_west": {
-        "start": "E3",
-        "end": "E2",
-        "stops": ["S7_w", "S3_w"],
-        "roads": ["R14", "R12", "R4"]
-    },
-    "Route_E2_E4_east": {
-        "start": "E2",
-        "end": "E4",
-        "stops": ["S3_e", "S7_e"],
-        "roads": ["R4", "R12", "R15"]
-    },
-    "Route_E2_E4_west": {
-        "start": "E4",
-        "end": "E2",
-        "stops": ["S7_w", "S3_w"],
-        "roads": ["R15", "R12", "R4"]
-    }
-}
-
-#Passenger entity
-class Passenger:
-    def __init__(self, env, passenger_id, arrival_time, destination):
-        self.env = env
-        self.passenger_id = passenger_id
-        self.arrival_time = arrival_time
-        self.destination = destination
-        self.boarding_time = None
-        self.total_travel_time = None
-
-#Passenger generator entity
-def passenger_generator(env, stop, bus_stop_queues, passenger_list):
+#Network from Lab 1 (arrival rates from Table 2, travel times from Table 1, routes), compiled to integer ids
+#The model runs on stop, route and terminal ids; names are only used to load the network and in traces
+NETWORK = load_network(os.path.join(NETWORKS_DIR, "lab1.json"))
+ROUTE_TABLE = NETWORK.route_table()
+
+#Terminal id -> ids of the routes starting there
+ROUTES_FROM = NETWORK.routes_from
+
+#Stop name <-> integer id, the passenger table stores stops as ids
+STOP_NAMES = NETWORK.stop_names
+
+#Origin-destination weights as an n x n matrix indexed by NETWORK.stop_ids, None for uniform over every other stop
+OD_WEIGHTS = None
+
+#Passengers on board a bus (passenger table rows), grouped by destination stop id
+#Alighting at a stop only touches the passengers getting off there, and len() is the occupancy
+class PassengersOnBoard:
+    def __init__(self):
+        self.by_destination = {}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def board(self, row, destination):
+        self.by_destination.setdefault(destination, []).append(row)
+        self.count += 1
+
+    #Removes and returns everyone whose destination is stop_id, in boarding order
+    def alight(self, stop_id):
+        leaving = self.by_destination.pop(stop_id, [])
+        self.count -= len(leaving)
+        return leaving
+
+#Passenger generator entity for stop (an id), passengers are rows in the passengers table
+def passenger_generator(env, stop, bus_stop_queues, passengers, destination_sampler, rng, tracer=None, profiler=None):
+    trace_passengers = tracer is not None and tracer.enabled(PASSENGERS)
+    origin = stop
+    mean_interarrival_time = 1 / NETWORK.arrival_rates[stop]
     passenger_id = 0
     while True:
-        interarrival_time = random.expovariate(ARRIVAL_RATES[stop])
+        interarrival_time = rng.exponential(mean_interarrival_time)
         yield env.timeout(interarrival_time)  # Wait until next passenger arrives
 
+        if profiler is not None:
+            profiler.event("passenger_generator")
+            started = profiler.clock()
+
         #Create a new passenger 
         arrival_time = env.now
-        destination = random.choice([s for s in bus_stop_queues.keys() if s != stop])  # Ensure the destination is different from the current stop
-        passenger = Passenger(env, passenger_id, arrival_time, destination)
-        passenger_id += 1
+        destination = destination_sampler.draw(origin)  #never the current stop
+        row = passengers.add(passenger_id, origin, destination, arrival_time)
 
         #Add passenger to the bus stop queue
-        bus_stop_queues[stop].append(passenger)
-        passenger_list.append(passenger)
+        bus_stop_queues[stop].append(row)
 
-        print(f"Passenger {passenger.passenger_id} arrived at {stop} at time {env.now}")
+        if trace_passengers:
+            tracer.emit(PASSENGER_ARRIVED, env.now, tracer.name_id(STOP_NAMES[stop]), passenger_id)
+        passenger_id += 1
 
-#Bus entity
-def bus(env, bus_stop_queues, initial_route_name, utilization_record):
-    occ = 0
-    current_route_name = initial_route_name
-    current_route = routes[current_route_name]
-    passengers_on_board = []
+        if profiler is not None:
+            profiler.queue_length(stop, len(bus_stop_queues[stop]))
+            profiler.phase("arrival", started)
+
+#Lazy arrival mode: no SimPy process per stop, arrival times are drawn in blocks
+#and passengers are only added to the table when a bus (or the route switching) looks at the stop
+#Traced arrivals are therefore written when they are materialized, stamped with their own arrival time
+def lazy_bus_stop_queues(env, stops, passengers, destination_sampler, rng, demand, tracer=None):
+    trace_passengers = tracer is not None and tracer.enabled(PASSENGERS)
+    bus_stop_queues = []
+    next_ids = dict.fromkeys(stops, 0)  #passenger ids count from 0 at every stop, as in passenger_generator
+    for stop in stops:
+        origin = stop
+
+        def new_passengers(arrival_times, stop=stop, origin=origin):
+            n = len(arrival_times)
+            passenger_ids = np.arange(next_ids[stop], next_ids[stop] + n)
+            next_ids[stop] += n
+            rows = passengers.add_many(passenger_ids, origin, destination_sampler.draw_many(origin, n), arrival_times)
+            if trace_passengers:
+                for arrival_time, passenger_id in zip(arrival_times.tolist(), passenger_ids.tolist()):
+                    tracer.emit(PASSENGER_ARRIVED, arrival_time, tracer.name_id(STOP_NAMES[stop]), passenger_id)
+            return rows
+
+        bus_stop_queues.append(LazyStopQueue(env, ArrivalStream(NETWORK.arrival_rates[stop], rng), StopQueue(stop, demand), new_passengers))
+        demand.watch_lazy(stop, bus_stop_queues[stop])
+    return bus_stop_queues
+
+#Bus entity, starting on route initial_route (an id)
+def bus(env, bus_stop_queues, passengers, initial_route, utilization_stats, occupancy, demand, tracer=None, profiler=None):
+    trace_stops = tracer is not None and tracer.enabled(STOPS)
+    trace_passengers = tracer is not None and tracer.enabled(PASSENGERS)
+    recorded_occ = 0  #occupancy last reported to the fleet-wide occupancy integral
+    current_route = initial_route
+    passengers_on_board = PassengersOnBoard()
 
     while True:
-        route_stops = current_route["stops"]
-        route_roads = current_route["roads"]
+        route_stops = NETWORK.stops_of[current_route]
+        leg_times = NETWORK.leg_times_of[current_route]
 
         #Iterate over the roads and stops
-        for i in range(len(route_roads)):
+        for i in range(len(leg_times)):
             #Travel time for the road segment leading up to the next stop
-            travel_time = TRAVEL_TIMES[route_roads[i]]
+            travel_time = leg_times[i]
             yield env.timeout(travel_time)
+
+            if profiler is not None:
+                profiler.event("bus")
+                started = profiler.clock()
             
             #Stop operations if there is a corresponding stop for the current road
             if i < len(route_stops):
                 stop = route_stops[i]
-                print(f"Bus arriving at {stop} at time {env.now}")
+                if trace_stops:
+                    tracer.emit(BUS_ARRIVED, env.now, tracer.name_id(STOP_NAMES[stop]))
 
                 #Drop off passengers at their destination stop
-                passengers_to_leave = [p for p in passengers_on_board if p.destination == stop] #assuming random.uniform(0,1) <= PROB_LEAVE is not necessary since this is my own model, which is destination based.
-                for passenger in passengers_to_leave:
-                    passengers_on_board.remove(passenger)
-                    occ -= 1
-                    passenger.total_travel_time = env.now - passenger.boarding_time
-                    print(f"Passenger {passenger.passenger_id} left the bus at {stop} at time {env.now}")
+                passengers_to_leave = passengers_on_board.alight(stop) #assuming random.uniform(0,1) <= PROB_LEAVE is not necessary since this is my own model, which is destination based.
+                if passengers_to_leave:
+                    passengers.alighting_time[passengers_to_leave] = env.now
+                    if trace_passengers:
+                        for passenger_id in passengers.passenger_id[passengers_to_leave].tolist():
+                            tracer.emit(PASSENGER_LEFT, env.now, tracer.name_id(STOP_NAMES[stop]), passenger_id)
+                    passengers.retire(passengers_to_leave)
+
+                if profiler is not None:
+                    started = profiler.phase("alighting", started)
 
                 #Pick up passengers waiting at the stop
                 num_waiting = len(bus_stop_queues[stop])
-                num_boarding = min(num_waiting, CAPACITY - occ)
-                for _ in range(num_boarding):
-                    passenger = bus_stop_queues[stop].pop(0) #FIFO queue here 
-                    passenger.boarding_time = env.now
-                    passengers_on_board.append(passenger)
-                    occ += 1
-                    print(f"Passenger {passenger.passenger_id} boarded the bus at {stop} at time {env.now}")
-
-                print(f"Bus capacity now: {occ}/{CAPACITY}")
+                num_boarding = min(num_waiting, CAPACITY - len(passengers_on_board))
+                boarding = bus_stop_queues[stop].take(num_boarding) #FIFO queue here 
+                if boarding:
+                    passengers.boarding_time[boarding] = env.now
+                    for row, destination in zip(boarding, passengers.destination[boarding].tolist()):
+                        passengers_on_board.board(row, destination)
+                    if trace_passengers:
+                        for passenger_id in passengers.passenger_id[boarding].tolist():
+                            tracer.emit(PASSENGER_BOARDED, env.now, tracer.name_id(STOP_NAMES[stop]), passenger_id)
+
+                occ = len(passengers_on_board)
+                if trace_stops:
+                    tracer.emit(BUS_OCCUPANCY, env.now, occ, CAPACITY)
 
                 #Utilization calculations
                 utilization = occ / CAPACITY
-                utilization_record.append(utilization)
+                utilization_stats.add(utilization)
+                occupancy.change(env.now, occ - recorded_occ)
+                recorded_occ = occ
+                if profiler is not None:
+                    profiler.queue_length(stop, num_waiting)
+                    profiler.phase("boarding", started)
 
         """"""""""""""""""""""
         Route switching logic 
         """""""""""""""""""""""
         #Determine the next route dynamically based on the current route's end
-        current_end = current_route["end"]
-
-        most_waiting = 0
-        next_route_name = None
+        if profiler is not None:
+            started = profiler.clock()
+        current_end = NETWORK.end_of[current_route]
 
-        #Find all possible routes that start from the current end stop
-        possible_routes = [
-            route_name for route_name, route_data in routes.items() if route_data["start"] == current_end
-        ]
+        #Routes starting from the current end stop, from the index built once at start-up
+        possible_routes = ROUTES_FROM.get(current_end, [])
 
-        #Iterate over all possible routes and find the one with the most passengers waiting at all stops
-        for route_name in possible_routes:
-            total_waiting = sum(len(bus_stop_queues[stop]) for stop in routes[route_name]["stops"])  #Calculate total waiting passengers at all stops on the route
-            
-            if total_waiting > most_waiting:
-                most_waiting = total_waiting
-                next_route_name = route_name
+        #Pick the one with the most passengers waiting at all its stops (totals are kept up to date by the stop queues)
+        next_route = demand.busiest(possible_routes)
 
         #Update the current route to the one with the most waiting passengers
-        if next_route_name:
-            current_route_name = next_route_name
-            current_route = routes[current_route_name]
-            print(f"Bus switching to a new route: {current_route_name} at time {env.now}")
-        else:
-            print(f"No connecting route found from {current_end}. Continuing with the current route.")
-
-
+        if next_route is not None:
+            current_route = next_route
+            if trace_stops:
+                tracer.emit(ROUTE_SWITCH, env.now, tracer.name_id(NETWORK.route_names[current_route]))
+        elif trace_stops:
+            tracer.emit(NO_ROUTE, env.now, tracer.name_id(NETWORK.terminal_names[current_end]))
+        if profiler is not None:
+            profiler.phase("route_switch", started)
+
+
+
+#One replication of the model, driven by its own RNG stream
+#tracer is an optional event_trace.Tracer recording the events of this replication
+#until overrides SIMULATION_TIME and recorder is the accumulator class for the per-visit utilizations
+#profiler is an optional profiler.Profiler timing the phases of the buses and passenger generators
+def run_replication(n_b, seed, arrivals="process", engine="simpy", tracer=None, until=None, recorder=RunningStats, profiler=None):
+    rng = np.random.default_rng(seed)
+    env = make_environment(engine)
+    demand = RouteDemand(ROUTE_TABLE)
+    bus_stop_queues = [StopQueue(stop, demand) for stop in range(NETWORK.num_stops)]
+    passengers = PassengerTable()
+    destination_sampler = DestinationSampler(NETWORK.num_stops, rng, OD_WEIGHTS)
+
+    #Start a passenger generator process for each bus stop, or let the queues draw arrivals lazily
+    if arrivals == "lazy":
+        bus_stop_queues = lazy_bus_stop_queues(env, range(NETWORK.num_stops), passengers, destination_sampler, rng, demand, tracer)
+    else:
+        for stop in NETWORK.rate_stops:
+            env.process(passenger_generator(env, stop, bus_stop_queues, passengers, destination_sampler, rng, tracer, profiler))
+
+    #Start multiple buses
+    utilization_stats = recorder()
+    occupancy = TimeWeightedStats()
+    for i in range(n_b):
+        route = int(rng.integers(NETWORK.num_routes))  #Select random start route for each bus
+        env.process(bus(env, bus_stop_queues, passengers, route, utilization_stats, occupancy, demand, tracer, profiler))
+
+    #Run the simulation
+    if profiler is None:
+        env.run(until=SIMULATION_TIME if until is None else until)
+    else:
+        profiler.run(env, until=SIMULATION_TIME if until is None else until)
+    return utilization_stats, occupancy
 
 #for running several simulations and log them easily
-def run_simulation(nb_values, num_runs):
+#workers=1 runs the replications one by one, workers=None uses every core
+#arrivals="lazy" replaces the per-stop passenger processes with lazy_bus_stop_queues
+#engine="heapq" runs the model on event_engine.Environment instead of SimPy
+#utilization="visits" averages occ/CAPACITY over stop visits, "time" is the time-weighted fleet utilization
+#profiler is an optional profiler.Profiler that collects every replication's profile
+#tracer is an optional event_trace.Tracer that records the events of every run (workers=1 only)
+def run_simulation(nb_values, num_runs, seed=None, workers=1, arrivals="process", engine="simpy", utilization="visits", profiler=None, tracer=None):
     average_utilizations = []
     standard_errors = []
-
-    for n_b in nb_values:
-        utilization_records = []
-
-        for run in range(num_runs):
-            env = simpy.Environment()
-            bus_stop_queues = {stop: [] for route in routes.values() for stop in route["stops"]}
-            passenger_list = []
-
-            #Start a passenger generator process for each bus stop
-            for stop in ARRIVAL_RATES.keys():
-                env.process(passenger_generator(env, stop, bus_stop_queues, passenger_list))
-
-            #Start multiple buses
-            utilization_record = []
-            for i in range(n_b):
-                route = random.choice(list(routes.keys()))  #Select random start route for each bus
-                env.process(bus(env, bus_stop_queues, route, utilization_record))
-
-            #Run the simulation
-            env.run(until=SIMULATION_TIME)
-            utilization_records.append(np.mean(utilization_record))
+    if tracer is not None and workers != 1:
+        raise ValueError("A tracer can only record replications run in this process (workers=1)")
+
+    seeds = replication_seeds(seed, len(nb_values), num_runs)
+    tasks = replication_tasks([(n_b,) for n_b in nb_values], seeds)
+    replicate = partial(run_replication, arrivals=arrivals, engine=engine, tracer=tracer)
+    if profiler is not None:
+        profiled_results = run_replications(partial(profiled, replicate), tasks, workers)
+        results = [result for result, _ in profiled_results]
+        for _, replication_profiler in profiled_results:
+            profiler.merge(replication_profiler)
+    else:
+        results = run_replications(replicate, tasks, workers)
+
+    for i, n_b in enumerate(nb_values):
+        config_results = results[i * num_runs:(i + 1) * num_runs]
+        if utilization == "time":
+            utilization_records = [occupancy.mean(SIMULATION_TIME) / (n_b * CAPACITY) for _, occupancy in config_results]
+        else:
+            utilization_records = [utilization_stats.mean for utilization_stats, _ in config_results]
 
         #Calculate average utilization and standard error
         avg_utilization = np.mean(utilization_records)
@@ -222,16 +272,54 @@ def run_simulation(nb_values, num_runs):
 
     return average_utilizations, standard_errors
 
-#Run the simulation with different numbers of buses and plot results
-nb_values = [5, 7, 10, 15]
-num_runs = 15
-average_utilizations, standard_errors = run_simulation(nb_values, num_runs)
-
-plt.figure(figsize=(10, 6))
-plt.errorbar(nb_values, average_utilizations, yerr=standard_errors, fmt='o-', capsize=5, label='Average Utilization')
-plt.xlabel('Number of Buses ($n_b$)')
-plt.ylabel('Average Utilization')
-plt.title('Bus Utilization vs Number of Buses')
-plt.grid(True)
-plt.legend()
-plt.show()
\ No newline at end of file
+#Sequential version of run_simulation: replications are added to each n_b until the confidence interval
+#of the mean utilization is narrower than rel_precision times the mean, or max_runs is hit
+#Returns the averages and standard errors as run_simulation does plus the number of replications each n_b needed
+def run_sequential_simulation(nb_values, rel_precision=0.05, min_runs=5, max_runs=200, seed=None, workers=1, arrivals="process", engine="simpy", utilization="visits"):
+    def measure(config, result):
+        n_b = config[0]
+        utilization_stats, occupancy = result
+        if utilization == "time":
+            return {"utilization": occupancy.mean(SIMULATION_TIME) / (n_b * CAPACITY)}
+        return {"utilization": utilization_stats.mean}
+
+    configs = [(n_b,) for n_b in nb_values]
+    replicate = partial(run_replication, arrivals=arrivals, engine=engine)
+    outcomes = run_sequential(replicate, configs, measure, seed, rel_precision, min_runs, max_runs, workers=workers)
+
+    average_utilizations = [outcome["stats"]["utilization"].mean for outcome in outcomes]
+    standard_errors = [outcome["stats"]["utilization"].std() / np.sqrt(outcome["runs"]) for outcome in outcomes]
+    replications = [outcome["runs"] for outcome in outcomes]
+    return average_utilizations, standard_errors, replications
+
+#Steady-state alternative to run_simulation: one long run of run_time per n_b instead of many short ones
+#The warm-up is cut off by MSER-5 and the confidence intervals of the mean utilization come from
+#num_batches non-overlapping batch means of the rest (utilization per stop visit, as utilization="visits")
+#Returns one dict per n_b with the steady_state() estimate of each metric
+def run_batch_means(nb_values, run_time=10000, num_batches=20, seed=None, workers=1, arrivals="process", engine="simpy", confidence=0.95):
+    seeds = replication_seeds(seed, len(nb_values), 1)
+    tasks = replication_tasks([(n_b,) for n_b in nb_values], seeds)
+    results = run_replications(partial(run_replication, arrivals=arrivals, engine=engine, until=run_time, recorder=BatchSeries), tasks, workers)
+
+    estimates = []
+    for n_b, (utilization_series, _) in zip(nb_values, results):
+        estimates.append({
+            "n_b": n_b,
+            "utilization": steady_state(utilization_series, num_batches, confidence),
+        })
+    return estimates
+
+if __name__ == "__main__":
+    #Run the simulation with different numbers of buses and plot results
+    nb_values = [5, 7, 10, 15]
+    num_runs = 15
+    average_utilizations, standard_errors = run_simulation(nb_values, num_runs, workers=None)
+
+    plt.figure(figsize=(10, 6))
+    plt.errorbar(nb_values, average_utilizations, yerr=standard_errors, fmt='o-', capsize=5, label='Average Utilization')
+    plt.xlabel('Number of Buses ($n_b$)')
+    plt.ylabel('Average Utilization')
+    plt.title('Bus Utilization vs Number of Buses')
+    plt.grid(True)
+    plt.legend()
+    plt.show()
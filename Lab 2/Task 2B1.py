@@ -1,244 +1,426 @@
-import simpy
+import os
 import numpy as np
-import random
+from functools import partial
 import matplotlib.pyplot as plt
+from alighting import alight_random
+from destination_sampler import DestinationSampler
+from event_engine import make_environment
+from event_trace import STOPS, ROUTE_SWITCH, NO_ROUTE
+from lazy_arrivals import ArrivalStream, LazyStopQueue
+from passenger_table import PassengerTable
+from profiler import profiled
+from network import NETWORKS_DIR, load_network
+from route_demand import RouteDemand
+from batch_means import BatchSeries, steady_state
+from running_stats import RunningStats, TimeWeightedStats
+from stop_queue import StopQueue
+from parallel_runner import replication_seeds, replication_tasks, run_replications
+from result_cache import ResultCache, cached_replications
+from sequential_runner import run_sequential
+from adaptive_sweep import adaptive_sweep
+from surrogate import Surrogate, training_points
 
 #Parameters
 CAPACITY = 20  #Capacity of the bus
 PROB_LEAVE = 0.3 #Probability a passenger leaves at a bus stop
 SIMULATION_TIME = 100  #Simulation time
+MODEL_VERSION = 3  #Bump when a change to the model changes its results, so cached replications are not reused
 
 #Arrival rates for sensitivity analysis
 arrival_rates = [0.5, 1, 2, 3, 4]
 
-#Travel times
-TRAVEL_TIMES = {
-    "R1": 3, "R2": 7, "R3": 6,
-    "R4": 1, "R5": 4, "R6": 3,
-    "R7": 9, "R8": 1, "R9": 3,
-    "R10": 8, "R11": 8, "R12": 5,
-    "R13": 6, "R14": 2, "R15": 3
-}
-
-#Routes from Lab 1
-routes = {
-    "Route_E1_E3_east": {
-        "start": "E1",
-        "end": "E3",
-        "stops": ["S1_e", "S4_e", "S6_e"],
-        "roads": ["R1", "R5", "R8", "R13"]
-    },
-    "Route_E1_E3_west": {
-        "start": "E3",
-        "end": "E1",
-        "stops": ["S6_w", "S4_w", "S1_w"],
-        "roads": ["R13", "R8", "R5", "R1"]
-    },
-    "Route_E1_E4_east": {
-        "start": "E1",
-        "end": "E4",
-        "stops": ["S2_e", "S5_e", "S7_e"],
-        "roads": ["R2", "R7", "R11", "R15"]
-    },
-    "Route_E1_E4_west": {
-        "start": "E4",
-        "end": "E1",
-        "stops": ["S7_w", "S5_w", "S2_w"],
-        "roads": ["R15", "R11", "R7", "R2"]
-    },
-    "Route_E2_E3_east": {
-        "start": "E2",
-        "end": "E3",
-        "stops": ["S3_e", "S7_e"],
-        "roads": ["R4", "R12", "R14"]
-    },
-    "Route_E2_E3_west": {
-        "start": "E3",
-        "end": "E2",
-        "stops": ["S7_w", "S3_w"],
-        "roads": ["R14", "R12", "R4"]
-    },
-    "Route_E2_E4_east": {
-        "start": "E2",
-        "end": "E4",
-        "stops": ["S3_e", "S7_e"],
-        "roads": ["R4", "R12", "R15"]
-    },
-    "Route_E2_E4_west": {
-        "start": "E4",
-        "end": "E2",
-        "stops": ["S7_w", "S3_w"],
-        "roads": ["R15", "R12", "R4"]
-    }
-}
+#Network from Lab 1 (travel times and routes), compiled to integer ids
+#Its per-stop arrival rates are not used here, every stop gets the lambda of the sweep
+NETWORK = load_network(os.path.join(NETWORKS_DIR, "lab1.json"))
+ROUTE_TABLE = NETWORK.route_table()
+
+#Terminal id -> ids of the routes starting there
+ROUTES_FROM = NETWORK.routes_from
 
+#Stop name <-> integer id, the passenger table stores stops as ids
 
-#Passenger entity
-class Passenger:
-    def __init__(self, env, passenger_id, arrival_time, destination):
-        self.env = env
-        self.passenger_id = passenger_id
-        self.arrival_time = arrival_time
-        self.destination = destination
-        self.boarding_time = None
-        self.total_travel_time = None
+#Origin-destination weights as an n x n matrix indexed by NETWORK.stop_ids, None for uniform over every other stop
+OD_WEIGHTS = None
 
-#Passenger generator entity
-def passenger_generator(env, stop, bus_stop_queues, passenger_list, lambda_value):
+#Passenger generator entity for stop (an id), passengers are rows in the passengers table
+def passenger_generator(env, stop, bus_stop_queues, passengers, destination_sampler, lambda_value, rng, profiler=None):
+    origin = stop
     passenger_id = 0
     while True:
-        interarrival_time = random.expovariate(lambda_value)
+        interarrival_time = rng.exponential(1 / lambda_value)
         yield env.timeout(interarrival_time)  #Wait until next passenger arrives
 
+        if profiler is not None:
+            profiler.event("passenger_generator")
+            started = profiler.clock()
+
         #Create a new passenger
         arrival_time = env.now
-        destination = random.choice([s for s in bus_stop_queues.keys() if s != stop])  # Ensure the destination is different from the current stop
-        passenger = Passenger(env, passenger_id, arrival_time, destination)
+        destination = destination_sampler.draw(origin)  #never the current stop
+        row = passengers.add(passenger_id, origin, destination, arrival_time)
         passenger_id += 1
 
         #Add passenger to the bus stop queue
-        bus_stop_queues[stop].append(passenger)
-        passenger_list.append(passenger)
-
-#Bus entity
-def bus(env, bus_stop_queues, initial_route_name, utilization_record, travel_times):
+        bus_stop_queues[stop].append(row)
+
+        if profiler is not None:
+            profiler.queue_length(stop, len(bus_stop_queues[stop]))
+            profiler.phase("arrival", started)
+
+#Lazy arrival mode: no SimPy process per stop, arrival times are drawn in blocks
+#and passengers are only added to the table when a bus (or the route switching) looks at the stop
+def lazy_bus_stop_queues(env, stops, passengers, destination_sampler, lambda_value, rng, demand):
+    bus_stop_queues = []
+    next_ids = dict.fromkeys(stops, 0)  #passenger ids count from 0 at every stop, as in passenger_generator
+    for stop in stops:
+        origin = stop
+
+        def new_passengers(arrival_times, stop=stop, origin=origin):
+            n = len(arrival_times)
+            passenger_ids = np.arange(next_ids[stop], next_ids[stop] + n)
+            next_ids[stop] += n
+            return passengers.add_many(passenger_ids, origin, destination_sampler.draw_many(origin, n), arrival_times)
+
+        bus_stop_queues.append(LazyStopQueue(env, ArrivalStream(lambda_value, rng), StopQueue(stop, demand), new_passengers))
+        demand.watch_lazy(stop, bus_stop_queues[stop])
+    return bus_stop_queues
+
+#Bus entity, starting on route initial_route (an id), carrying at most capacity passengers
+#Route switches go to tracer (an optional event_trace.Tracer) instead of being printed
+def bus(env, bus_stop_queues, passengers, initial_route, utilization_stats, occupancy, travel_time_stats, rng, demand, profiler=None, capacity=CAPACITY, tracer=None):
+    trace_stops = tracer is not None and tracer.enabled(STOPS)
     occ = 0
-    current_route_name = initial_route_name
-    current_route = routes[current_route_name]
+    recorded_occ = 0  #occupancy last reported to the fleet-wide occupancy integral
+    current_route = initial_route
     passengers_on_board = []
 
     while True:
-        route_stops = current_route["stops"]
-        route_roads = current_route["roads"]
+        route_stops = NETWORK.stops_of[current_route]
+        leg_times = NETWORK.leg_times_of[current_route]
 
         #Iterate over the roads and stops
-        for i in range(len(route_roads)):
+        for i in range(len(leg_times)):
             #Travel time for the road segment leading up to the next stop
-            travel_time = TRAVEL_TIMES[route_roads[i]]
+            travel_time = leg_times[i]
             yield env.timeout(travel_time)
+
+            if profiler is not None:
+                profiler.event("bus")
+                started = profiler.clock()
             
             #Stop operations if there is a corresponding stop for the current road
             if i < len(route_stops):
                 stop = route_stops[i]
 
                 #Drop off passengers at their destination stop
-                passengers_to_leave = [p for p in passengers_on_board if random.uniform(0, 1) <= PROB_LEAVE]
-                for passenger in passengers_to_leave:
-                    passengers_on_board.remove(passenger)
-                    occ -= 1
-                    passenger.total_travel_time = env.now - passenger.boarding_time
-                    travel_times.append(passenger.total_travel_time)
+                passengers_to_leave = alight_random(passengers_on_board, PROB_LEAVE, rng)  #one binomial draw instead of one uniform per passenger
+                occ -= len(passengers_to_leave)
+                if passengers_to_leave:
+                    passengers.alighting_time[passengers_to_leave] = env.now
+                    travel_time_stats.add_many(env.now - passengers.boarding_time[passengers_to_leave])
+                    passengers.retire(passengers_to_leave)
+
+                if profiler is not None:
+                    started = profiler.phase("alighting", started)
 
                 #Pick up passengers waiting at the stop
                 num_waiting = len(bus_stop_queues[stop])
-                num_boarding = min(num_waiting, CAPACITY - occ)
-                for _ in range(num_boarding):
-                    passenger = bus_stop_queues[stop].pop(0)
-                    passenger.boarding_time = env.now
-                    passengers_on_board.append(passenger)
-                    occ += 1
+                num_boarding = min(num_waiting, capacity - occ)
+                boarding = bus_stop_queues[stop].take(num_boarding)
+                if boarding:
+                    passengers.boarding_time[boarding] = env.now
+                    passengers_on_board.extend(boarding)
+                    occ += num_boarding
 
                 #Utilization calculations
-                utilization = occ / CAPACITY
-                utilization_record.append(utilization)
+                utilization = occ / capacity
+                utilization_stats.add(utilization)
+                occupancy.change(env.now, occ - recorded_occ)
+                recorded_occ = occ
+                if profiler is not None:
+                    profiler.queue_length(stop, num_waiting)
+                    profiler.phase("boarding", started)
 
         """"""""""""""""""""""
         Route switching logic 
         """""""""""""""""""""""
         #Determine the next route dynamically based on the current route's end
-        current_end = current_route["end"]
+        if profiler is not None:
+            started = profiler.clock()
+        current_end = NETWORK.end_of[current_route]
 
-        most_waiting = 0
-        next_route_name = None
+        #Routes starting from the current end stop, from the index built once at start-up
+        possible_routes = ROUTES_FROM.get(current_end, [])
 
-        #Find all possible routes that start from the current end stop
-        possible_routes = [
-            route_name for route_name, route_data in routes.items() if route_data["start"] == current_end
-        ]
-
-        #Iterate over all possible routes and find the one with the most passengers waiting at all stops
-        for route_name in possible_routes:
-            total_waiting = sum(len(bus_stop_queues[stop]) for stop in routes[route_name]["stops"])  #Calculate total waiting passengers at all stops on the route
-            
-            if total_waiting > most_waiting:
-                most_waiting = total_waiting
-                next_route_name = route_name
+        #Pick the one with the most passengers waiting at all its stops (totals are kept up to date by the stop queues)
+        next_route = demand.busiest(possible_routes)
 
         #Update the current route to the one with the most waiting passengers
-        if next_route_name:
-            current_route_name = next_route_name
-            current_route = routes[current_route_name]
-            print(f"Bus switching to a new route: {current_route_name} at time {env.now}")
-        else:
-            print(f"No connecting route found from {current_end}. Continuing with the current route.")
+        if next_route is not None:
+            current_route = next_route
+            if trace_stops:
+                tracer.emit(ROUTE_SWITCH, env.now, tracer.name_id(NETWORK.route_names[current_route]))
+        elif trace_stops:
+            tracer.emit(NO_ROUTE, env.now, tracer.name_id(NETWORK.terminal_names[current_end]))
+        if profiler is not None:
+            profiler.phase("route_switch", started)
+
+
+#One replication of the model, driven by its own RNG stream
+#until overrides SIMULATION_TIME and recorder is the accumulator class for the per-visit utilizations and travel times
+#profiler is an optional profiler.Profiler timing the phases of the buses and passenger generators
+#capacity overrides CAPACITY (the adaptive sweep varies it)
+#tracer is an optional event_trace.Tracer recording the route switches of this replication
+def run_replication(n_b, lambda_value, seed, arrivals="process", engine="simpy", until=None, recorder=RunningStats, profiler=None, capacity=None, tracer=None):
+    capacity = CAPACITY if capacity is None else capacity
+    rng = np.random.default_rng(seed)
+    env = make_environment(engine)
+    demand = RouteDemand(ROUTE_TABLE)
+    bus_stop_queues = [StopQueue(stop, demand) for stop in range(NETWORK.num_stops)]
+    passengers = PassengerTable()
+    destination_sampler = DestinationSampler(NETWORK.num_stops, rng, OD_WEIGHTS)
+    travel_time_stats = recorder()
+
+    #Start a passenger generator process for each bus stop, or let the queues draw arrivals lazily
+    if arrivals == "lazy":
+        bus_stop_queues = lazy_bus_stop_queues(env, range(NETWORK.num_stops), passengers, destination_sampler, lambda_value, rng, demand)
+    else:
+        for stop in range(NETWORK.num_stops):
+            env.process(passenger_generator(env, stop, bus_stop_queues, passengers, destination_sampler, lambda_value, rng, profiler))
+
+    #Start multiple buses
+    utilization_stats = recorder()
+    occupancy = TimeWeightedStats()
+    for i in range(n_b):
+        route = int(rng.integers(NETWORK.num_routes))  #Select random start route for each bus
+        env.process(bus(env, bus_stop_queues, passengers, route, utilization_stats, occupancy, travel_time_stats, rng, demand, profiler, capacity, tracer))
+
+    #Run the simulation
+    if profiler is None:
+        env.run(until=SIMULATION_TIME if until is None else until)
+    else:
+        profiler.run(env, until=SIMULATION_TIME if until is None else until)
+    return utilization_stats, occupancy, travel_time_stats
+
+#Full configuration of one replication, hashed into its result cache key (capacity None is CAPACITY)
+#network is NETWORK.to_dict(), which callers describing many replications compute once and pass in
+def replication_config(n_b, lambda_value, seed, arrivals="process", capacity=None, network=None):
+    return {
+        "model": "Task 2B1", "version": MODEL_VERSION, "network": NETWORK.to_dict() if network is None else network,
+        "capacity": CAPACITY if capacity is None else capacity, "prob_leave": PROB_LEAVE,
+        "od_weights": OD_WEIGHTS, "horizon": SIMULATION_TIME, "arrivals": arrivals,
+        "n_b": n_b, "lambda_value": lambda_value, "seed": seed,
+    }
 
+#Scalars of one replication kept with it in the result cache, for ResultCache.export
+def replication_summary(result):
+    utilization_stats, occupancy, travel_time_stats = result
+    return {
+        "utilization": utilization_stats.mean,
+        "occupancy": occupancy.mean(SIMULATION_TIME),
+        "travel_time": travel_time_stats.mean,
+        "travel_time_count": travel_time_stats.count,
+    }
 
 #Function to run simulations and log results
-def run_simulation(nb_values, num_runs, lambda_value):
+#workers=1 runs the replications one by one, workers=None uses every core
+#arrivals="lazy" replaces the per-stop passenger processes with lazy_bus_stop_queues
+#engine="heapq" runs the model on event_engine.Environment instead of SimPy
+#utilization="visits" averages occ/CAPACITY over stop visits, "time" is the time-weighted fleet utilization
+#cache is an optional result_cache.ResultCache: replications found in it are not simulated again
+#(only with a seed: seed=None draws fresh entropy, so its entries could never be hit again and are not stored)
+#profiler is an optional profiler.Profiler that collects every replication's profile (profiled runs skip the cache)
+#tracer is an optional event_trace.Tracer that records the route switches of every run (workers=1 only, traced runs skip the cache)
+def run_simulation(nb_values, num_runs, lambda_value, seed=None, workers=1, arrivals="process", engine="simpy", utilization="visits", cache=None, profiler=None, tracer=None):
     average_utilizations = []
     average_travel_times = []
+    if tracer is not None and workers != 1:
+        raise ValueError("A tracer can only record replications run in this process (workers=1)")
+
+    seeds = replication_seeds(seed, len(nb_values), num_runs)
+    tasks = replication_tasks([(n_b, lambda_value) for n_b in nb_values], seeds)
+    replicate = partial(run_replication, arrivals=arrivals, engine=engine, tracer=tracer)
+    if profiler is not None:
+        profiled_results = run_replications(partial(profiled, replicate), tasks, workers)
+        results = [result for result, _ in profiled_results]
+        for _, replication_profiler in profiled_results:
+            profiler.merge(replication_profiler)
+    elif cache is None or seed is None or tracer is not None:
+        results = run_replications(replicate, tasks, workers)
+    else:
+        results = cached_replications(cache, replicate, tasks, partial(replication_config, arrivals=arrivals, network=NETWORK.to_dict()), replication_summary, workers)
+
+    for i, n_b in enumerate(nb_values):
+        config_results = results[i * num_runs:(i + 1) * num_runs]
+        if utilization == "time":
+            utilization_records = [occupancy.mean(SIMULATION_TIME) / (n_b * CAPACITY) for _, occupancy, _ in config_results]
+        else:
+            utilization_records = [utilization_stats.mean for utilization_stats, _, _ in config_results]
 
-    for n_b in nb_values:
-        utilization_records = []
-        travel_times = []
-
-        for run in range(num_runs):
-            env = simpy.Environment()
-            bus_stop_queues = {stop: [] for route in routes.values() for stop in route["stops"]}
-            passenger_list = []
-
-            #Start a passenger generator process for each bus stop
-            for stop in bus_stop_queues.keys():
-                env.process(passenger_generator(env, stop, bus_stop_queues, passenger_list, lambda_value))
-
-            #Start multiple buses
-            utilization_record = []
-            for i in range(n_b):
-                route = random.choice(list(routes.keys()))  #Select random start route for each bus
-                env.process(bus(env, bus_stop_queues, route, utilization_record, travel_times))
-
-            #Run the simulation
-            env.run(until=SIMULATION_TIME)
-            utilization_records.append(np.mean(utilization_record))
+        #Pool the travel times of every replication
+        travel_time_stats = RunningStats()
+        for _, _, run_travel_time_stats in config_results:
+            travel_time_stats.merge(run_travel_time_stats)
 
         #Calculate average utilization
         avg_utilization = np.mean(utilization_records)
         average_utilizations.append(avg_utilization)
 
         #Calculate average travel time
-        avg_travel_time = np.mean(travel_times) if len(travel_times) > 0 else 0
+        avg_travel_time = travel_time_stats.mean if travel_time_stats.count > 0 else 0
         average_travel_times.append(avg_travel_time)
 
     return average_utilizations, average_travel_times
 
-nb_values = [5, 7, 10, 15]
-num_runs = 15
-results = {}
-
-for lambda_value in arrival_rates:
-    avg_utilizations, avg_travel_times = run_simulation(nb_values, num_runs, lambda_value)
-    results[lambda_value] = (avg_utilizations, avg_travel_times)
-
-#Plotting all the lambda values and their corresponding Bus Utilization here
-plt.figure(figsize=(10, 6))
-for lambda_value, (avg_utilizations, avg_travel_times) in results.items():
-    plt.plot(nb_values, avg_utilizations, marker='o', linestyle='-', label=f'λ = {lambda_value}')
-
-plt.xlabel('Number of Buses ($n_b$)')
-plt.ylabel('Average Utilization')
-plt.title('Bus Utilization Sensitivity to Arrival Rates')
-plt.grid(True)
-plt.legend()
-plt.show()
-
-#Plotting average travel time vs number of buses
-plt.figure(figsize=(10, 6))
-for lambda_value, (avg_utilizations, avg_travel_times) in results.items():
-    plt.plot(nb_values, avg_travel_times, marker='o', linestyle='-', label=f'λ = {lambda_value}')
-
-plt.xlabel('Number of Buses ($n_b$)')
-plt.ylabel('Average Travel Time')
-plt.title('Average Travel Time Sensitivity to Number of Buses')
-plt.grid(True)
-plt.legend()
-plt.show()
+#Sequential version of run_simulation: replications are added to each n_b until the confidence intervals
+#of the mean utilization and travel time are narrower than rel_precision times the mean, or max_runs is hit
+#Returns the averages as run_simulation does plus the number of replications each n_b needed
+def run_sequential_simulation(nb_values, lambda_value, rel_precision=0.05, min_runs=5, max_runs=200, seed=None, workers=1, arrivals="process", engine="simpy", utilization="visits"):
+    def measure(config, result):
+        n_b = config[0]
+        utilization_stats, occupancy, travel_time_stats = result
+        if utilization == "time":
+            utilization_value = occupancy.mean(SIMULATION_TIME) / (n_b * CAPACITY)
+        else:
+            utilization_value = utilization_stats.mean
+        return {"utilization": utilization_value, "travel_time": travel_time_stats.mean if travel_time_stats.count > 0 else 0}
+
+    configs = [(n_b, lambda_value) for n_b in nb_values]
+    replicate = partial(run_replication, arrivals=arrivals, engine=engine)
+    outcomes = run_sequential(replicate, configs, measure, seed, rel_precision, min_runs, max_runs, workers=workers)
+
+    average_utilizations = []
+    average_travel_times = []
+    replications = []
+    for outcome in outcomes:
+        #Pool the travel times of every replication, as run_simulation does
+        travel_time_stats = RunningStats()
+        for _, _, run_travel_time_stats in outcome["results"]:
+            travel_time_stats.merge(run_travel_time_stats)
+
+        average_utilizations.append(outcome["stats"]["utilization"].mean)
+        average_travel_times.append(travel_time_stats.mean if travel_time_stats.count > 0 else 0)
+        replications.append(outcome["runs"])
+
+    return average_utilizations, average_travel_times, replications
+
+#Steady-state alternative to run_simulation: one long run of run_time per n_b instead of many short ones
+#The warm-up is cut off by MSER-5 and the confidence intervals of the mean utilization and travel time come from
+#num_batches non-overlapping batch means of the rest (utilization per stop visit, as utilization="visits")
+#Returns one dict per n_b with the steady_state() estimate of each metric
+def run_batch_means(nb_values, lambda_value, run_time=10000, num_batches=20, seed=None, workers=1, arrivals="process", engine="simpy", confidence=0.95):
+    seeds = replication_seeds(seed, len(nb_values), 1)
+    tasks = replication_tasks([(n_b, lambda_value) for n_b in nb_values], seeds)
+    results = run_replications(partial(run_replication, arrivals=arrivals, engine=engine, until=run_time, recorder=BatchSeries), tasks, workers)
+
+    estimates = []
+    for n_b, (utilization_series, _, travel_time_series) in zip(nb_values, results):
+        estimates.append({
+            "n_b": n_b,
+            "utilization": steady_state(utilization_series, num_batches, confidence),
+            "travel_time": steady_state(travel_time_series, num_batches, confidence),
+        })
+    return estimates
+
+#One replication of the adaptive sweep's (n_b, lambda_value, capacity) configs
+def sweep_replication(n_b, lambda_value, capacity, seed, arrivals="process", engine="simpy"):
+    return run_replication(n_b, lambda_value, seed, arrivals=arrivals, engine=engine, capacity=capacity)
+
+#Adaptive alternative to the fixed n_b x lambda grid: adaptive_sweep over space (n_b, lambda_value, capacity bounds)
+#with about budget replications, placing configs where utilization or travel time bends or is uncertain
+#Returns adaptive_sweep's list of configs with their per-metric RunningStats
+def run_adaptive_sweep(budget=300, space=None, runs=5, batch=4, seed=None, workers=1, arrivals="process", engine="simpy", utilization="visits"):
+    def measure(config, result):
+        n_b, _, capacity = config
+        utilization_stats, occupancy, travel_time_stats = result
+        if utilization == "time":
+            utilization_value = occupancy.mean(SIMULATION_TIME) / (n_b * capacity)
+        else:
+            utilization_value = utilization_stats.mean
+        return {"utilization": utilization_value, "travel_time": travel_time_stats.mean if travel_time_stats.count > 0 else 0}
+
+    space = space or {"n_b": (5, 15), "lambda_value": (0.5, 4.0), "capacity": (10, 40)}
+    replicate = partial(sweep_replication, arrivals=arrivals, engine=engine)
+    return adaptive_sweep(replicate, measure, space, budget, runs=runs, batch=batch, seed=seed, workers=workers)
+
+#Surrogate answering "utilization and travel time at (n_b, lambda_value, capacity)" without simulating when it can
+#It is trained on every replication of this model in cache, and a query it is unsure about runs num_runs
+#replications (stored in cache too when seed is given, so the next surrogate starts from them). Utilization is per stop visit.
+def build_surrogate(cache=None, bounds=None, num_runs=10, rel_threshold=0.05, seed=None, workers=1, arrivals="process", engine="simpy"):
+    inputs = ["n_b", "lambda_value", "capacity"]
+    metrics = ["utilization", "travel_time"]
+    seeds = np.random.SeedSequence(seed)
+    replicate = partial(sweep_replication, arrivals=arrivals, engine=engine)
+
+    def simulate(group, config):
+        tasks = [(*config, run_seed) for run_seed in seeds.spawn(num_runs)]
+        if cache is None or seed is None:  #unseeded replications could never be looked up again
+            results = run_replications(replicate, tasks, workers)
+        else:
+            network = NETWORK.to_dict()
+
+            def describe(n_b, lambda_value, capacity, run_seed):
+                return replication_config(n_b, lambda_value, run_seed, arrivals, capacity, network)
+
+            results = cached_replications(cache, replicate, tasks, describe, replication_summary, workers)
+        stats = {metric: RunningStats() for metric in metrics}
+        for result in results:
+            summary = replication_summary(result)
+            for metric in metrics:
+                if np.isfinite(summary[metric]):
+                    stats[metric].add(summary[metric])
+        return stats
+
+    surrogate = Surrogate(simulate, bounds or {"n_b": (1, 40), "lambda_value": (0.1, 10.0), "capacity": (5, 60)}, rel_threshold)
+    if cache is not None:
+        surrogate.train(training_points(cache, replication_config(None, None, None, arrivals), inputs, metrics))
+    return surrogate
+
+if __name__ == "__main__":
+    nb_values = [5, 7, 10, 15]
+    num_runs = 15
+    results = {}
+    cache = ResultCache()  #re-running the script (e.g. to change a plot) loads the replications from here
+
+    for lambda_value in arrival_rates:
+        avg_utilizations, avg_travel_times = run_simulation(nb_values, num_runs, lambda_value, seed=2024, workers=None, cache=cache)
+        results[lambda_value] = (avg_utilizations, avg_travel_times)
+
+    #Plotting all the lambda values and their corresponding Bus Utilization here
+    plt.figure(figsize=(10, 6))
+    for lambda_value, (avg_utilizations, avg_travel_times) in results.items():
+        plt.plot(nb_values, avg_utilizations, marker='o', linestyle='-', label=f'λ = {lambda_value}')
+
+    plt.xlabel('Number of Buses ($n_b$)')
+    plt.ylabel('Average Utilization')
+    plt.title('Bus Utilization Sensitivity to Arrival Rates')
+    plt.grid(True)
+    plt.legend()
+    plt.show()
+
+    #Plotting average travel time vs number of buses
+    plt.figure(figsize=(10, 6))
+    for lambda_value, (avg_utilizations, avg_travel_times) in results.items():
+        plt.plot(nb_values, avg_travel_times, marker='o', linestyle='-', label=f'λ = {lambda_value}')
+
+    plt.xlabel('Number of Buses ($n_b$)')
+    plt.ylabel('Average Travel Time')
+    plt.title('Average Travel Time Sensitivity to Number of Buses')
+    plt.grid(True)
+    plt.legend()
+    plt.show()
+
+    #Replications each configuration needs for 95% intervals within 5% of the mean
+    for lambda_value in arrival_rates:
+        _, _, replications = run_sequential_simulation(nb_values, lambda_value, rel_precision=0.05, workers=None)
+        print(f"λ = {lambda_value}: " + ", ".join(f"n_b={n_b}: {runs} runs" for n_b, runs in zip(nb_values, replications)))
+
+    #Adaptive sweep over n_b, lambda and CAPACITY with a third of the replications of the grid above
+    sweep = run_adaptive_sweep(budget=len(arrival_rates) * len(nb_values) * num_runs // 3, seed=2024, workers=None)
+    print(f"Adaptive sweep: {len(sweep)} configs from {sum(outcome['runs'] for outcome in sweep)} replications")
+
+    #Surrogate trained on the cached grid above, answering configurations between the grid points
+    surrogate = build_surrogate(cache, seed=2024, workers=None)
+    for config in [(8, 1.5, CAPACITY), (12, 2.5, CAPACITY)]:
+        estimates, simulated = surrogate.query(config)
+        print(f"n_b={config[0]}, λ={config[1]}, capacity={config[2]}: " + ", ".join(f"{metric} {mean:.3f} ± {std:.3f}" for metric, (mean, std) in estimates.items()) + (" (simulated)" if simulated else ""))
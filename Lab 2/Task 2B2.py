@@ -1,257 +1,533 @@
-import simpy
+import os
 import numpy as np
-import random
+from functools import partial
 import matplotlib.pyplot as plt
+from alighting import alight_random
+from destination_sampler import DestinationSampler
+from event_engine import make_environment
+from lazy_arrivals import ArrivalStream, LazyStopQueue
+from passenger_table import PassengerTable
+from profiler import profiled
+from network import NETWORKS_DIR, load_network
+from route_demand import RouteDemand
+from batch_means import BatchSeries, steady_state
+from running_stats import RunningStats, TimeWeightedStats
+from stop_queue import StopQueue
+from parallel_runner import replication_seeds, replication_tasks, run_replications
+from result_cache import ResultCache, cached_replications
+from surrogate import Surrogate, training_points
+from sequential_runner import run_sequential
+from variance_reduction import ALIGHTING, ARRIVALS, DESTINATIONS, INITIAL_ROUTES, ROUTE_CHOICE, ReplicationStreams
 
 #Parameters
 CAPACITY = 20  #Capacity of the bus
 PROB_LEAVE = 0.3 #Probability a passenger leaves at a bus stop
 SIMULATION_TIME = 100  #Simulation time
+MODEL_VERSION = 3  #Bump when a change to the model changes its results, so cached replications are not reused
 
-#Arrival rates for each bus stop
-ARRIVAL_RATES = {
-    "S1_e": 0.3, "S1_w": 0.6,
-    "S2_e": 0.1, "S2_w": 0.1,
-    "S3_e": 0.3, "S3_w": 0.9,
-    "S4_e": 0.2, "S4_w": 0.5,
-    "S5_e": 0.6, "S5_w": 0.4,
-    "S6_e": 0.6, "S6_w": 0.4,
-    "S7_e": 0.6, "S7_w": 0.4
-}
-
-#Travel times for each road segment
-TRAVEL_TIMES = {
-    "R1": 3, "R2": 7, "R3": 6,
-    "R4": 1, "R5": 4, "R6": 3,
-    "R7": 9, "R8": 1, "R9": 3,
-    "R10": 8, "R11": 8, "R12": 5,
-    "R13": 6, "R14": 2, "R15": 3
-}
-
-#Routes from Lab 1
-routes = {
-    "Route_E1_E3_east": {
-        "start": "E1",
-        "end": "E3",
-        "stops": ["S1_e", "S4_e", "S6_e"],
-        "roads": ["R1", "R5", "R8", "R13"]
-    },
-    "Route_E1_E3_west": {
-        "start": "E3",
-        "end": "E1",
-        "stops": ["S6_w", "S4_w", "S1_w"],
-        "roads": ["R13", "R8", "R5", "R1"]
-    },
-    "Route_E1_E4_east": {
-        "start": "E1",
-        "end": "E4",
-        "stops": ["S2_e", "S5_e", "S7_e"],
-        "roads": ["R2", "R7", "R11", "R15"]
-    },
-    "Route_E1_E4_west": {
-        "start": "E4",
-        "end": "E1",
-        "stops": ["S7_w", "S5_w", "S2_w"],
-        "roads": ["R15", "R11", "R7", "R2"]
-    },
-    "Route_E2_E3_east": {
-        "start": "E2",
-        "end": "E3",
-        "stops": ["S3_e", "S7_e"],
-        "roads": ["R4", "R12", "R14"]
-    },
-    "Route_E2_E3_west": {
-        "start": "E3",
-        "end": "E2",
-        "stops": ["S7_w", "S3_w"],
-        "roads": ["R14", "R12", "R4"]
-    },
-    "Route_E2_E4_east": {
-        "start": "E2",
-        "end": "E4",
-        "stops": ["S3_e", "S7_e"],
-        "roads": ["R4", "R12", "R15"]
-    },
-    "Route_E2_E4_west": {
-        "start": "E4",
-        "end": "E2",
-        "stops": ["S7_w", "S3_w"],
-        "roads": ["R15", "R12", "R4"]
-    }
-}
-
-#Passenger entity
-class Passenger:
-    def __init__(self, env, passenger_id, arrival_time, destination):
-        self.env = env
-        self.passenger_id = passenger_id
-        self.arrival_time = arrival_time
-        self.destination = destination
-        self.boarding_time = None
-        self.total_travel_time = None
-
-#Passenger generator entity
-def passenger_generator(env, stop, bus_stop_queues, passenger_list):
+#Network from Lab 1 (arrival rate per stop, travel time per road, routes), compiled to integer ids
+#The model runs on stop, route and terminal ids; names are only used to load the network and to report
+NETWORK = load_network(os.path.join(NETWORKS_DIR, "lab1.json"))
+ROUTE_TABLE = NETWORK.route_table()
+
+#Terminal id -> ids of the routes starting there
+ROUTES_FROM = NETWORK.routes_from
+
+#Stop name <-> integer id, the passenger table stores stops as ids
+
+#Origin-destination weights as an n x n matrix indexed by NETWORK.stop_ids, None for uniform over every other stop
+OD_WEIGHTS = None
+
+#Passenger generator entity for stop (an id), passengers are rows in the passengers table
+def passenger_generator(env, stop, bus_stop_queues, passengers, destination_sampler, rng, profiler=None):
+    origin = stop
+    mean_interarrival_time = 1 / NETWORK.arrival_rates[stop]
     passenger_id = 0
     while True:
-        interarrival_time = random.expovariate(ARRIVAL_RATES[stop])
+        interarrival_time = rng.exponential(mean_interarrival_time)
         yield env.timeout(interarrival_time)  #Wait until next passenger arrives
 
+        if profiler is not None:
+            profiler.event("passenger_generator")
+            started = profiler.clock()
+
         #Create a new passenger
         arrival_time = env.now
-        destination = random.choice([s for s in bus_stop_queues.keys() if s != stop])  #Ensure the destination is different from the current stop
-        passenger = Passenger(env, passenger_id, arrival_time, destination)
+        destination = destination_sampler.draw(origin)  #never the current stop
+        row = passengers.add(passenger_id, origin, destination, arrival_time)
         passenger_id += 1
 
         #Add passenger to the bus stop queue
-        bus_stop_queues[stop].append(passenger)
-        passenger_list.append(passenger)
-
-#Bus entity
-def bus(env, bus_stop_queues, initial_route_name, utilization_record, travel_times, strategy):
-    occ = 0
-    current_route_name = initial_route_name
-    current_route = routes[current_route_name]
-    passengers_on_board = []
+        bus_stop_queues[stop].append(row)
+
+        if profiler is not None:
+            profiler.queue_length(stop, len(bus_stop_queues[stop]))
+            profiler.phase("arrival", started)
+
+#Lazy arrival mode: no SimPy process per stop, arrival times are drawn in blocks
+#and passengers are only added to the table when a bus (or the route switching) looks at the stop
+#arrival_rngs holds the generator of the arrival times of every stop, by stop id
+def lazy_bus_stop_queues(env, stops, passengers, destination_sampler, arrival_rngs, demand):
+    bus_stop_queues = []
+    next_ids = dict.fromkeys(stops, 0)  #passenger ids count from 0 at every stop, as in passenger_generator
+    for stop in stops:
+        origin = stop
+
+        def new_passengers(arrival_times, stop=stop, origin=origin):
+            n = len(arrival_times)
+            passenger_ids = np.arange(next_ids[stop], next_ids[stop] + n)
+            next_ids[stop] += n
+            return passengers.add_many(passenger_ids, origin, destination_sampler.draw_many(origin, n), arrival_times)
+
+        bus_stop_queues.append(LazyStopQueue(env, ArrivalStream(NETWORK.arrival_rates[stop], arrival_rngs[stop], start_time=env.now), StopQueue(stop, demand), new_passengers))
+        demand.watch_lazy(stop, bus_stop_queues[stop])
+    return bus_stop_queues
+
+#Where a bus is: its route id, the road it is on (leg) and when it reaches the end of it, the passenger rows
+#on board and the occupancy. bus() keeps it current at every yield, so the model can be snapshotted between
+#events and a bus restarted from a copy. A new state (leg_end None) starts at the beginning of route.
+class BusState:
+    def __init__(self, route, leg=0, leg_end=None, passengers_on_board=None, occ=0):
+        self.route = route
+        self.leg = leg
+        self.leg_end = leg_end
+        self.passengers_on_board = [] if passengers_on_board is None else passengers_on_board
+        self.occ = occ
+
+    def copy(self):
+        return BusState(self.route, self.leg, self.leg_end, list(self.passengers_on_board), self.occ)
+
+#Bus entity, rng draws who alights and route_rng the next route of the random strategy
+def bus(env, bus_stop_queues, passengers, state, utilization_stats, occupancy, travel_time_stats, strategy, rng, route_rng, demand, profiler=None):
+    occ = state.occ
+    recorded_occ = occ  #occupancy last reported to the fleet-wide occupancy integral
+    current_route = state.route
+    passengers_on_board = state.passengers_on_board
+    first_leg = state.leg
+    resume_at = state.leg_end  #set when resuming in the middle of a leg
 
     while True:
-        route_stops = current_route["stops"]
-        route_roads = current_route["roads"]
+        route_stops = NETWORK.stops_of[current_route]
+        leg_times = NETWORK.leg_times_of[current_route]
 
         #Iterate over the roads and stops
-        for i in range(len(route_roads)):
+        for i in range(first_leg, len(leg_times)):
             #Travel time for the road segment leading up to the next stop
-            travel_time = TRAVEL_TIMES[route_roads[i]]
+            if resume_at is None:
+                travel_time = leg_times[i]
+            else:
+                travel_time = resume_at - env.now
+                resume_at = None
+            state.leg = i
+            state.leg_end = env.now + travel_time
             yield env.timeout(travel_time)
+
+            if profiler is not None:
+                profiler.event("bus")
+                started = profiler.clock()
             
             #Stop operations if there is a corresponding stop for the current road
             if i < len(route_stops):
                 stop = route_stops[i]
 
                 #Drop off passengers at their destination stop
-                passengers_to_leave = [p for p in passengers_on_board if random.uniform(0, 1) <= PROB_LEAVE]
-                for passenger in passengers_to_leave:
-                    passengers_on_board.remove(passenger)
-                    occ -= 1
-                    passenger.total_travel_time = env.now - passenger.boarding_time
-                    travel_times.append(passenger.total_travel_time)
+                passengers_to_leave = alight_random(passengers_on_board, PROB_LEAVE, rng)  #one binomial draw instead of one uniform per passenger
+                occ -= len(passengers_to_leave)
+                if passengers_to_leave:
+                    passengers.alighting_time[passengers_to_leave] = env.now
+                    travel_time_stats.add_many(env.now - passengers.boarding_time[passengers_to_leave])
+                    passengers.retire(passengers_to_leave)
+
+                if profiler is not None:
+                    started = profiler.phase("alighting", started)
 
                 #Pick up passengers waiting at the stop
                 num_waiting = len(bus_stop_queues[stop])
                 num_boarding = min(num_waiting, CAPACITY - occ)
-                for _ in range(num_boarding):
-                    passenger = bus_stop_queues[stop].pop(0)
-                    passenger.boarding_time = env.now
-                    passengers_on_board.append(passenger)
-                    occ += 1
+                boarding = bus_stop_queues[stop].take(num_boarding)
+                if boarding:
+                    passengers.boarding_time[boarding] = env.now
+                    passengers_on_board.extend(boarding)
+                    occ += num_boarding
 
                 #Utilization calculations
                 utilization = occ / CAPACITY
-                utilization_record.append(utilization)
+                utilization_stats.add(utilization)
+                occupancy.change(env.now, occ - recorded_occ)
+                recorded_occ = occ
+                state.occ = occ
+                if profiler is not None:
+                    profiler.queue_length(stop, num_waiting)
+                    profiler.phase("boarding", started)
 
         """"""""""""""""""""""
         Route switching logic
         """""""""""""""""""""""
         #Determine the next route dynamically based on the current route's end
-        current_end = current_route["end"]
+        if profiler is not None:
+            started = profiler.clock()
+        current_end = NETWORK.end_of[current_route]
 
         if strategy == "demand":
             #Demand-based route selection
-            most_waiting = 0
-            next_route_name = None
-
-            #Find all possible routes that start from the current end stop
-            possible_routes = [
-                route_name for route_name, route_data in routes.items() if route_data["start"] == current_end
-            ]
-
-            #Iterate over all possible routes and find the one with the most passengers waiting at all stops
-            for route_name in possible_routes:
-                total_waiting = sum(len(bus_stop_queues[stop]) for stop in routes[route_name]["stops"])  #Calculate total waiting passengers at all stops on the route
-                
-                if total_waiting > most_waiting:
-                    most_waiting = total_waiting
-                    next_route_name = route_name
+            #Routes starting from the current end stop, from the index built once at start-up
+            possible_routes = ROUTES_FROM.get(current_end, [])
+
+            #Pick the one with the most passengers waiting at all its stops (totals are kept up to date by the stop queues)
+            next_route = demand.busiest(possible_routes)
         else:
             #Random route selection strategy
-            possible_routes = [
-                route_name for route_name, route_data in routes.items() if route_data["start"] == current_end
-            ]
-            next_route_name = random.choice(possible_routes) if possible_routes else None
+            possible_routes = ROUTES_FROM.get(current_end, [])
+            next_route = possible_routes[route_rng.integers(len(possible_routes))] if possible_routes else None
 
         #Update the current route to the one chosen by the strategy
-        if next_route_name:
-            current_route_name = next_route_name
-            current_route = routes[current_route_name]
+        if next_route is not None:
+            current_route = next_route
+        state.route = current_route
+        first_leg = 0
+        if profiler is not None:
+            profiler.phase("route_switch", started)
             
 
+#One replication of the model, driven by its own RNG stream
+#crn=True gives every purpose its own substream (arrivals and destinations per stop, alighting and
+#route choice per bus), so runs of both strategies with the same seed see the same passengers.
+#antithetic is passed to ReplicationStreams: None for plain streams, False/True for an antithetic pair.
+#until overrides SIMULATION_TIME and recorder is the accumulator class for the per-visit utilizations and travel times
+#profiler is an optional profiler.Profiler timing the phases of the buses and passenger generators
+def run_replication(n_b, strategy, seed, arrivals="process", engine="simpy", crn=False, antithetic=None, until=None, recorder=RunningStats, profiler=None):
+    if crn:
+        streams = ReplicationStreams(seed, antithetic)
+        arrival_rngs = [streams.stream(ARRIVALS, stop) for stop in range(NETWORK.num_stops)]
+        destination_rngs = [streams.stream(DESTINATIONS, stop) for stop in range(NETWORK.num_stops)]
+        bus_rngs = [streams.stream(ALIGHTING, i) for i in range(n_b)]
+        route_rngs = [streams.stream(ROUTE_CHOICE, i) for i in range(n_b)]
+        initial_route_rng = streams.stream(INITIAL_ROUTES)
+    else:
+        rng = np.random.default_rng(seed)
+        arrival_rngs = [rng] * NETWORK.num_stops
+        destination_rngs = rng
+        bus_rngs = route_rngs = [rng] * n_b
+        initial_route_rng = rng
+
+    env = make_environment(engine)
+    demand = RouteDemand(ROUTE_TABLE)
+    passengers = PassengerTable()
+    destination_sampler = DestinationSampler(NETWORK.num_stops, destination_rngs, OD_WEIGHTS)
+    bus_stop_queues = start_stops(env, passengers, destination_sampler, arrivals, arrival_rngs, demand, profiler=profiler)
+
+    #Start multiple buses
+    bus_states = [BusState(int(initial_route_rng.integers(NETWORK.num_routes))) for _ in range(n_b)]  #Select random start route for each bus
+    stats = start_buses(env, bus_stop_queues, passengers, bus_states, strategy, bus_rngs, route_rngs, demand, recorder, profiler)
+
+    #Run the simulation
+    if profiler is None:
+        env.run(until=SIMULATION_TIME if until is None else until)
+    else:
+        profiler.run(env, until=SIMULATION_TIME if until is None else until)
+    return stats
+
+#Stop queues of a run starting at env.now, with a passenger generator process per stop or lazy arrivals
+#queued optionally lists the passenger rows already waiting at every stop (when resuming from a snapshot)
+#The queues, like arrival_rngs, are a list indexed by stop id
+def start_stops(env, passengers, destination_sampler, arrivals, arrival_rngs, demand, queued=None, profiler=None):
+    stops = range(NETWORK.num_stops)
+    bus_stop_queues = [StopQueue(stop, demand) for stop in stops]
+    if arrivals == "lazy":
+        bus_stop_queues = lazy_bus_stop_queues(env, stops, passengers, destination_sampler, arrival_rngs, demand)
+    else:
+        for stop in stops:
+            env.process(passenger_generator(env, stop, bus_stop_queues, passengers, destination_sampler, arrival_rngs[stop], profiler))
+    for stop, rows in enumerate(queued or []):
+        bus_stop_queues[stop].extend(rows)
+    return bus_stop_queues
+
+#Starts one bus process per BusState, returns the (utilization_stats, occupancy, travel_time_stats) they record into
+def start_buses(env, bus_stop_queues, passengers, bus_states, strategy, bus_rngs, route_rngs, demand, recorder=RunningStats, profiler=None):
+    utilization_stats = recorder()
+    occupancy = TimeWeightedStats(env.now, sum(state.occ for state in bus_states))
+    travel_time_stats = recorder()
+    for state, rng, route_rng in zip(bus_states, bus_rngs, route_rngs):
+        env.process(bus(env, bus_stop_queues, passengers, state, utilization_stats, occupancy, travel_time_stats, strategy, rng, route_rng, demand, profiler))
+    return utilization_stats, occupancy, travel_time_stats
+
+#Full model state at one time: the passengers waiting at every stop, every bus, the passenger table and the RNG
+#Pending arrivals are not stored: inter-arrival times are exponential, so redrawing them at resume time is exact
+class Snapshot:
+    def __init__(self, time, strategy, queued, bus_states, passengers, rng_state):
+        self.time = time
+        self.strategy = strategy
+        self.queued = queued
+        self.bus_states = bus_states
+        self.passengers = passengers
+        self.rng_state = rng_state
+
+#Runs the model from cold start until warmup_time and returns its Snapshot, to fork replications from
+def take_snapshot(n_b, strategy, seed, warmup_time, arrivals="process", engine="simpy"):
+    rng = np.random.default_rng(seed)
+    env = make_environment(engine)
+    demand = RouteDemand(ROUTE_TABLE)
+    passengers = PassengerTable()
+    destination_sampler = DestinationSampler(NETWORK.num_stops, rng, OD_WEIGHTS)
+    bus_stop_queues = start_stops(env, passengers, destination_sampler, arrivals, [rng] * NETWORK.num_stops, demand)
+    bus_states = [BusState(int(rng.integers(NETWORK.num_routes))) for _ in range(n_b)]
+    start_buses(env, bus_stop_queues, passengers, bus_states, strategy, [rng] * n_b, [rng] * n_b, demand)
+    env.run(until=warmup_time)
+
+    queued = [list(queue) for queue in bus_stop_queues]
+    return Snapshot(env.now, strategy, queued, [state.copy() for state in bus_states], passengers.copy(), rng.bit_generator.state)
+
+#Continues the model from a snapshot until the absolute time until, without replaying the warm-up
+#What-if variants: strategy switches the route strategy, add_buses starts extra buses at random routes.
+#seed=None continues the snapshot's own RNG stream, any other seed gives an independent continuation.
+#Returns (utilization_stats, occupancy, travel_time_stats) of the period after the snapshot only.
+def fork(snapshot, until, strategy=None, add_buses=0, seed=None, arrivals="process", engine="simpy", recorder=RunningStats):
+    rng = np.random.default_rng(seed)
+    if seed is None:
+        rng.bit_generator.state = snapshot.rng_state
+    env = make_environment(engine, snapshot.time)
+    demand = RouteDemand(ROUTE_TABLE)
+    passengers = snapshot.passengers.copy()
+    destination_sampler = DestinationSampler(NETWORK.num_stops, rng, OD_WEIGHTS)
+    bus_stop_queues = start_stops(env, passengers, destination_sampler, arrivals, [rng] * NETWORK.num_stops, demand, snapshot.queued)
+    bus_states = [state.copy() for state in snapshot.bus_states]
+    bus_states += [BusState(int(rng.integers(NETWORK.num_routes))) for _ in range(add_buses)]
+    stats = start_buses(env, bus_stop_queues, passengers, bus_states, strategy or snapshot.strategy, [rng] * len(bus_states), [rng] * len(bus_states), demand, recorder)
+    env.run(until=until)
+    return stats
+
+#num_runs replications of each what-if variant from one snapshot, e.g. variants=[{}, {"strategy": "random"}, {"add_buses": 2}]
+#Every variant gets the same seeds. Returns one list of fork() results per variant.
+def run_variants(snapshot, variants, num_runs, until, seed=None, workers=1, arrivals="process", engine="simpy"):
+    seeds = replication_seeds(seed, 1, num_runs)[0]
+    tasks = [(snapshot, until, variant.get("strategy"), variant.get("add_buses", 0), run_seed) for variant in variants for run_seed in seeds]
+    results = run_replications(partial(fork, arrivals=arrivals, engine=engine), tasks, workers)
+    return [results[i * num_runs:(i + 1) * num_runs] for i in range(len(variants))]
+
+#Full configuration of one replication, hashed into its result cache key
+#network is NETWORK.to_dict(), which callers describing many replications compute once and pass in
+def replication_config(n_b, strategy, seed, arrivals="process", network=None):
+    return {
+        "model": "Task 2B2", "version": MODEL_VERSION, "network": NETWORK.to_dict() if network is None else network,
+        "capacity": CAPACITY, "prob_leave": PROB_LEAVE,
+        "od_weights": OD_WEIGHTS, "horizon": SIMULATION_TIME, "arrivals": arrivals,
+        "n_b": n_b, "strategy": strategy, "seed": seed,
+    }
+
+#Scalars of one replication kept with it in the result cache, for ResultCache.export
+def replication_summary(result):
+    utilization_stats, occupancy, travel_time_stats = result
+    return {
+        "utilization": utilization_stats.mean,
+        "occupancy": occupancy.mean(SIMULATION_TIME),
+        "travel_time": travel_time_stats.mean,
+        "travel_time_count": travel_time_stats.count,
+    }
+
 #Function to run simulations and log results
-def run_simulation(nb_values, num_runs, strategy):
+#workers=1 runs the replications one by one, workers=None uses every core
+#arrivals="lazy" replaces the per-stop passenger processes with lazy_bus_stop_queues
+#engine="heapq" runs the model on event_engine.Environment instead of SimPy
+#utilization="visits" averages occ/CAPACITY over stop visits, "time" is the time-weighted fleet utilization
+#cache is an optional result_cache.ResultCache: replications found in it are not simulated again
+#(only with a seed: seed=None draws fresh entropy, so its entries could never be hit again and are not stored)
+#profiler is an optional profiler.Profiler that collects every replication's profile (profiled runs skip the cache)
+def run_simulation(nb_values, num_runs, strategy, seed=None, workers=1, arrivals="process", engine="simpy", utilization="visits", cache=None, profiler=None):
     average_utilizations = []
     average_travel_times = []
 
-    for n_b in nb_values:
-        utilization_records = []
-        travel_times = []
-
-        for run in range(num_runs):
-            env = simpy.Environment()
-            bus_stop_queues = {stop: [] for route in routes.values() for stop in route["stops"]}
-            passenger_list = []
-
-            #Start a passenger generator process for each bus stop
-            for stop in bus_stop_queues.keys():
-                env.process(passenger_generator(env, stop, bus_stop_queues, passenger_list))
-
-            #Start multiple buses
-            utilization_record = []
-            for i in range(n_b):
-                route = random.choice(list(routes.keys()))  #Select random start route for each bus
-                env.process(bus(env, bus_stop_queues, route, utilization_record, travel_times, strategy))
+    seeds = replication_seeds(seed, len(nb_values), num_runs)
+    tasks = replication_tasks([(n_b, strategy) for n_b in nb_values], seeds)
+    replicate = partial(run_replication, arrivals=arrivals, engine=engine)
+    if profiler is not None:
+        profiled_results = run_replications(partial(profiled, replicate), tasks, workers)
+        results = [result for result, _ in profiled_results]
+        for _, replication_profiler in profiled_results:
+            profiler.merge(replication_profiler)
+    elif cache is None or seed is None:
+        results = run_replications(replicate, tasks, workers)
+    else:
+        results = cached_replications(cache, replicate, tasks, partial(replication_config, arrivals=arrivals, network=NETWORK.to_dict()), replication_summary, workers)
+
+    for i, n_b in enumerate(nb_values):
+        config_results = results[i * num_runs:(i + 1) * num_runs]
+        if utilization == "time":
+            utilization_records = [occupancy.mean(SIMULATION_TIME) / (n_b * CAPACITY) for _, occupancy, _ in config_results]
+        else:
+            utilization_records = [utilization_stats.mean for utilization_stats, _, _ in config_results]
 
-            #Run the simulation
-            env.run(until=SIMULATION_TIME)
-            utilization_records.append(np.mean(utilization_record))
+        #Pool the travel times of every replication
+        travel_time_stats = RunningStats()
+        for _, _, run_travel_time_stats in config_results:
+            travel_time_stats.merge(run_travel_time_stats)
 
         #Calculate average utilization
         avg_utilization = np.mean(utilization_records)
         average_utilizations.append(avg_utilization)
 
         #Calculate average travel time
-        avg_travel_time = np.mean(travel_times) if len(travel_times) > 0 else 0
+        avg_travel_time = travel_time_stats.mean if travel_time_stats.count > 0 else 0
         average_travel_times.append(avg_travel_time)
 
     return average_utilizations, average_travel_times
 
-nb_values = [5, 7, 10, 15]
-num_runs = 15
-strategies = ["demand", "random"]
-results = {}
-
-for strategy in strategies:
-    avg_utilizations, avg_travel_times = run_simulation(nb_values, num_runs, strategy)
-    results[strategy] = (avg_utilizations, avg_travel_times)
-
-#Plotting average utilization for both strategies
-plt.figure(figsize=(10, 6))
-for strategy, (avg_utilizations, avg_travel_times) in results.items():
-    plt.plot(nb_values, avg_utilizations, marker='o', linestyle='-', label=f'{strategy.capitalize()} Utilization')
-
-plt.xlabel('Number of Buses ($n_b$)')
-plt.ylabel('Average Utilization')
-plt.title('Bus Utilization for Different Route Selection Strategies')
-plt.grid(True)
-plt.legend()
-plt.show()
-
-#Plotting average travel time for both strategies
-plt.figure(figsize=(10, 6))
-for strategy, (avg_utilizations, avg_travel_times) in results.items():
-    plt.plot(nb_values, avg_travel_times, marker='o', linestyle='-', label=f'{strategy.capitalize()} Travel Time')
-
-plt.xlabel('Number of Buses ($n_b$)')
-plt.ylabel('Average Travel Time')
-plt.title('Average Travel Time for Different Route Selection Strategies')
-plt.grid(True)
-plt.legend()
-plt.show()
+#Sequential version of run_simulation: replications are added to each n_b until the confidence intervals
+#of the mean utilization and travel time are narrower than rel_precision times the mean, or max_runs is hit
+#Returns the averages as run_simulation does plus the number of replications each n_b needed
+def run_sequential_simulation(nb_values, strategy, rel_precision=0.05, min_runs=5, max_runs=200, seed=None, workers=1, arrivals="process", engine="simpy", utilization="visits"):
+    def measure(config, result):
+        n_b = config[0]
+        utilization_stats, occupancy, travel_time_stats = result
+        if utilization == "time":
+            utilization_value = occupancy.mean(SIMULATION_TIME) / (n_b * CAPACITY)
+        else:
+            utilization_value = utilization_stats.mean
+        return {"utilization": utilization_value, "travel_time": travel_time_stats.mean if travel_time_stats.count > 0 else 0}
+
+    configs = [(n_b, strategy) for n_b in nb_values]
+    replicate = partial(run_replication, arrivals=arrivals, engine=engine)
+    outcomes = run_sequential(replicate, configs, measure, seed, rel_precision, min_runs, max_runs, workers=workers)
+
+    average_utilizations = []
+    average_travel_times = []
+    replications = []
+    for outcome in outcomes:
+        #Pool the travel times of every replication, as run_simulation does
+        travel_time_stats = RunningStats()
+        for _, _, run_travel_time_stats in outcome["results"]:
+            travel_time_stats.merge(run_travel_time_stats)
+
+        average_utilizations.append(outcome["stats"]["utilization"].mean)
+        average_travel_times.append(travel_time_stats.mean if travel_time_stats.count > 0 else 0)
+        replications.append(outcome["runs"])
+
+    return average_utilizations, average_travel_times, replications
+
+#Steady-state alternative to run_simulation: one long run of run_time per n_b instead of many short ones
+#The warm-up is cut off by MSER-5 and the confidence intervals of the mean utilization and travel time come from
+#num_batches non-overlapping batch means of the rest (utilization per stop visit, as utilization="visits")
+#Returns one dict per n_b with the steady_state() estimate of each metric
+def run_batch_means(nb_values, strategy, run_time=10000, num_batches=20, seed=None, workers=1, arrivals="process", engine="simpy", confidence=0.95):
+    seeds = replication_seeds(seed, len(nb_values), 1)
+    tasks = replication_tasks([(n_b, strategy) for n_b in nb_values], seeds)
+    results = run_replications(partial(run_replication, arrivals=arrivals, engine=engine, until=run_time, recorder=BatchSeries), tasks, workers)
+
+    estimates = []
+    for n_b, (utilization_series, _, travel_time_series) in zip(nb_values, results):
+        estimates.append({
+            "n_b": n_b,
+            "utilization": steady_state(utilization_series, num_batches, confidence),
+            "travel_time": steady_state(travel_time_series, num_batches, confidence),
+        })
+    return estimates
+
+#Paired comparison of the "demand" and "random" strategies with common random numbers
+#Both strategies are run on the same seeds with crn=True, so the per-seed difference leaves out most of the
+#passenger noise. antithetic=True also runs every seed on 1 - U and averages the two differences.
+#Returns one dict per n_b and metric with the mean difference (demand - random), the half-width of its
+#confidence interval and the variance reduction: the variance independent runs would give for the same
+#number of replications, divided by the variance of the paired differences.
+def compare_strategies(nb_values, num_runs, seed=None, workers=1, antithetic=False, arrivals="process", engine="simpy", confidence=0.95):
+    variants = [False, True] if antithetic else [None]
+    strategies = ["demand", "random"]
+    seeds = replication_seeds(seed, len(nb_values), num_runs)
+    tasks = [(n_b, strategy, run_seed, arrivals, engine, True, variant)
+             for n_b, config_seeds in zip(nb_values, seeds)
+             for run_seed in config_seeds
+             for strategy in strategies
+             for variant in variants]
+    results = iter(run_replications(run_replication, tasks, workers))
+
+    comparisons = []
+    for n_b, config_seeds in zip(nb_values, seeds):
+        metrics = {name: {"difference": RunningStats(), "demand": RunningStats(), "random": RunningStats()} for name in ("utilization", "travel_time")}
+        for _ in config_seeds:
+            values = {name: {} for name in metrics}
+            for strategy in strategies:
+                for variant in variants:
+                    utilization_stats, occupancy, travel_time_stats = next(results)
+                    values["utilization"].setdefault(strategy, []).append(utilization_stats.mean)
+                    values["travel_time"].setdefault(strategy, []).append(travel_time_stats.mean if travel_time_stats.count > 0 else 0)
+            for name, stats in metrics.items():
+                for strategy in strategies:
+                    for value in values[name][strategy]:
+                        stats[strategy].add(value)
+                stats["difference"].add(np.mean(values[name]["demand"]) - np.mean(values[name]["random"]))
+
+        for name, stats in metrics.items():
+            independent_variance = (stats["demand"].variance(1) + stats["random"].variance(1)) / len(variants)
+            comparisons.append({
+                "n_b": n_b,
+                "metric": name,
+                "difference": stats["difference"].mean,
+                "half_width": stats["difference"].half_width(confidence),
+                "variance_reduction": independent_variance / stats["difference"].variance(1),
+            })
+    return comparisons
+
+#Surrogate answering "utilization and travel time with n_b buses under strategy" without simulating when it can
+#One Gaussian process per strategy, trained on every replication of this model in cache; a query it is unsure
+#about runs num_runs replications (stored in cache too when seed is given). Utilization is per stop visit.
+def build_surrogate(cache=None, max_buses=40, num_runs=10, rel_threshold=0.05, seed=None, workers=1, arrivals="process", engine="simpy"):
+    metrics = ["utilization", "travel_time"]
+    seeds = np.random.SeedSequence(seed)
+    replicate = partial(run_replication, arrivals=arrivals, engine=engine)
+
+    def simulate(strategy, config):
+        tasks = [(config[0], strategy, run_seed) for run_seed in seeds.spawn(num_runs)]
+        if cache is None or seed is None:  #unseeded replications could never be looked up again
+            results = run_replications(replicate, tasks, workers)
+        else:
+            results = cached_replications(cache, replicate, tasks, partial(replication_config, arrivals=arrivals, network=NETWORK.to_dict()), replication_summary, workers)
+        stats = {metric: RunningStats() for metric in metrics}
+        for result in results:
+            summary = replication_summary(result)
+            for metric in metrics:
+                if np.isfinite(summary[metric]):
+                    stats[metric].add(summary[metric])
+        return stats
+
+    surrogate = Surrogate(simulate, {"n_b": (1, max_buses)}, rel_threshold)
+    if cache is not None:
+        surrogate.train(training_points(cache, replication_config(None, None, None, arrivals), ["n_b"], metrics, group_key="strategy"))
+    return surrogate
+
+if __name__ == "__main__":
+    nb_values = [5, 7, 10, 15]
+    num_runs = 15
+    strategies = ["demand", "random"]
+    results = {}
+    cache = ResultCache()  #re-running the script (e.g. to change a plot) loads the replications from here
+
+    for strategy in strategies:
+        avg_utilizations, avg_travel_times = run_simulation(nb_values, num_runs, strategy, seed=2024, workers=None, cache=cache)
+        results[strategy] = (avg_utilizations, avg_travel_times)
+
+    #Plotting average utilization for both strategies
+    plt.figure(figsize=(10, 6))
+    for strategy, (avg_utilizations, avg_travel_times) in results.items():
+        plt.plot(nb_values, avg_utilizations, marker='o', linestyle='-', label=f'{strategy.capitalize()} Utilization')
+
+    plt.xlabel('Number of Buses ($n_b$)')
+    plt.ylabel('Average Utilization')
+    plt.title('Bus Utilization for Different Route Selection Strategies')
+    plt.grid(True)
+    plt.legend()
+    plt.show()
+
+    #Plotting average travel time for both strategies
+    plt.figure(figsize=(10, 6))
+    for strategy, (avg_utilizations, avg_travel_times) in results.items():
+        plt.plot(nb_values, avg_travel_times, marker='o', linestyle='-', label=f'{strategy.capitalize()} Travel Time')
+
+    plt.xlabel('Number of Buses ($n_b$)')
+    plt.ylabel('Average Travel Time')
+    plt.title('Average Travel Time for Different Route Selection Strategies')
+    plt.grid(True)
+    plt.legend()
+    plt.show()
+
+    #Paired demand - random differences with common random numbers and antithetic pairs
+    print("n_b  metric        demand - random   95% CI half-width   variance reduction")
+    for row in compare_strategies(nb_values, num_runs, workers=None, antithetic=True):
+        print(f"{row['n_b']:<4} {row['metric']:<13} {row['difference']:>15.4f} {row['half_width']:>19.4f} {row['variance_reduction']:>20.1f}x")
@@ -0,0 +1,111 @@
+import numpy as np
+from parallel_runner import run_replications
+from running_stats import RunningStats
+
+#Latin hypercube of num_points points in the unit cube: one point per stratum of every dimension, strata shuffled per dimension
+def latin_hypercube(num_points, dimensions, rng):
+    strata = np.array([rng.permutation(num_points) for _ in range(dimensions)]).T
+    return (strata + rng.random((num_points, dimensions))) / num_points
+
+#Parameter space {name: (low, high)}, a dimension is integer when both bounds are ints
+#Points move between the unit cube (where distances are measured) and configs (tuples in the order of space)
+class Space:
+    def __init__(self, bounds):
+        self.names = list(bounds)
+        self.low = np.array([low for low, _ in bounds.values()], dtype=float)
+        self.high = np.array([high for _, high in bounds.values()], dtype=float)
+        self.integer = [isinstance(low, int) and isinstance(high, int) for low, high in bounds.values()]
+
+    def config(self, unit_point):
+        values = self.low + np.asarray(unit_point) * (self.high - self.low)
+        return tuple(int(round(value)) if integer else float(value) for value, integer in zip(values.tolist(), self.integer))
+
+    def unit(self, config):
+        return (np.array(config, dtype=float) - self.low) / np.where(self.high > self.low, self.high - self.low, 1)
+
+#Adaptive sweep of replicate(*config, seed) over space, spending about budget replications
+#It starts from a Latin hypercube of initial_points configs with runs replications each, then every round scores
+#each config by three terms, each scaled to its largest value over the configs:
+#  curvature:   misfit of a linear model through the config's nearest neighbours (how far the response bends there)
+#  coverage:    share of a random cloud of candidates nearest to it (its Voronoi cell, how much space it stands for)
+#  uncertainty: half-width of its confidence interval relative to the spread of the metric over the configs
+#For the batch highest scores, a config whose largest term is uncertainty gets runs more replications and
+#any other gets a new neighbour, the candidate in its cell farthest from it (LOLA-Voronoi style). A new
+#config that rounds onto an existing one adds replications to that one instead.
+#measure(config, result) maps one replication to {metric: value}, every metric counts in the scores.
+#Configs get the children of seed in the order they are added and their replications the children of those.
+#Returns one dict per config (in the order they were added) with its config, per-metric RunningStats and replications.
+def adaptive_sweep(replicate, measure, space, budget, initial_points=None, runs=5, batch=4, seed=None, workers=1, candidates=2000, confidence=0.95):
+    space = space if isinstance(space, Space) else Space(space)
+    dimensions = len(space.names)
+    root = np.random.SeedSequence(seed)
+    rng = np.random.default_rng(root.spawn(1)[0])
+    outcomes = []
+    index = {}
+
+    def schedule(config, pending):
+        i = index.get(config)
+        if i is None:
+            i = index[config] = len(outcomes)
+            outcomes.append({"config": dict(zip(space.names, config)), "values": config, "seed": root.spawn(1)[0], "stats": {}, "runs": 0})
+        pending[i] = pending.get(i, 0) + runs
+
+    def run(pending):
+        tasks = []
+        owners = []
+        for i, extra in pending.items():
+            for run_seed in outcomes[i]["seed"].spawn(extra):
+                tasks.append((*outcomes[i]["values"], run_seed))
+                owners.append(i)
+        for i, result in zip(owners, run_replications(replicate, tasks, workers)):
+            outcome = outcomes[i]
+            outcome["runs"] += 1
+            for name, value in measure(outcome["values"], result).items():
+                outcome["stats"].setdefault(name, RunningStats()).add(value)
+        return len(tasks)
+
+    pending = {}
+    for point in latin_hypercube(initial_points or max(2 * dimensions + 2, 8), dimensions, rng):
+        schedule(space.config(point), pending)
+    spent = run(pending)
+
+    while spent < budget:
+        points = np.array([space.unit(outcome["values"]) for outcome in outcomes])
+        metrics = list(outcomes[0]["stats"])
+        means = np.array([[outcome["stats"][name].mean for name in metrics] for outcome in outcomes])
+        widths = np.array([[outcome["stats"][name].half_width(confidence) for name in metrics] for outcome in outcomes])
+        scale = means.std(axis=0)
+        scale[scale == 0] = 1
+
+        #Curvature: RMS residual of a least-squares plane through each config and its nearest neighbours
+        distances = np.linalg.norm(points[:, None, :] - points[None, :, :], axis=2)
+        num_neighbours = min(2 * dimensions + 2, len(outcomes))
+        curvature = np.zeros(len(outcomes))
+        if num_neighbours > dimensions + 1:
+            for i, neighbours in enumerate(np.argsort(distances, axis=1)[:, :num_neighbours]):
+                design = np.hstack([np.ones((num_neighbours, 1)), points[neighbours]])
+                fitted = design @ np.linalg.lstsq(design, means[neighbours], rcond=None)[0]
+                curvature[i] = (np.sqrt(((fitted - means[neighbours]) ** 2).mean(axis=0)) / scale).max()
+
+        #Coverage: Voronoi cell of each config, estimated from a random cloud of candidates
+        cloud = rng.random((candidates, dimensions))
+        owner = np.argmin(np.linalg.norm(cloud[:, None, :] - points[None, :, :], axis=2), axis=1)
+        coverage = np.bincount(owner, minlength=len(outcomes)) / candidates
+
+        #Uncertainty: a config with too few replications for an interval counts as the most uncertain one
+        uncertainty = np.nan_to_num(widths / scale, nan=np.inf).max(axis=1)
+        finite = np.isfinite(uncertainty)
+        uncertainty[~finite] = uncertainty[finite].max() if finite.any() else 1
+
+        terms = np.array([curvature, coverage, uncertainty]).T
+        terms = terms / np.where(terms.max(axis=0) > 0, terms.max(axis=0), 1)
+        pending = {}
+        for i in np.argsort(-terms.sum(axis=1))[:batch]:
+            cell = cloud[owner == i]
+            if np.argmax(terms[i]) == 2 or len(cell) == 0:
+                pending[i] = pending.get(i, 0) + runs
+            else:
+                schedule(space.config(cell[np.argmax(np.linalg.norm(cell - points[i], axis=1))]), pending)
+        spent += run(pending)
+
+    return [{"config": outcome["config"], "stats": outcome["stats"], "runs": outcome["runs"]} for outcome in outcomes]
@@ -0,0 +1,21 @@
+import numpy as np
+
+#Removes and returns the passengers leaving at a stop when each one leaves independently with probability prob_leave
+#Same distribution as one uniform draw per passenger: the number leaving is Binomial(n, prob_leave) and,
+#given that number, every subset is equally likely. The leavers are picked by a partial Fisher-Yates shuffle:
+#the j-th one is uniform over the n - j passengers still on board, swapped with the last passenger and popped.
+#All the picks come from one vectorized draw, so the cost is proportional to the number leaving
+#(the order of passengers_on_board is not kept)
+def alight_random(passengers_on_board, prob_leave, rng):
+    n = len(passengers_on_board)
+    num_leaving = rng.binomial(n, prob_leave) if n > 0 else 0
+    if num_leaving == 0:
+        return []
+
+    leaving = []
+    picks = (rng.random(num_leaving) * np.arange(n, n - num_leaving, -1)).astype(np.int64)
+    for index in picks.tolist():
+        leaving.append(passengers_on_board[index])
+        passengers_on_board[index] = passengers_on_board[-1]
+        passengers_on_board.pop()
+    return leaving
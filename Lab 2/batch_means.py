@@ -0,0 +1,83 @@
+import numpy as np
+from running_stats import RunningStats
+
+#Output series of one long run kept as means of consecutive groups of batch_size observations
+#Has the add/add_many of RunningStats, so the bus processes can record into it unchanged.
+#batch_size=5 gives the series MSER-5 works on while storing a fifth of the observations.
+class BatchSeries:
+    def __init__(self, batch_size=5):
+        self.batch_size = batch_size
+        self.means = np.zeros(1024)
+        self.num_means = 0
+        self.partial = []  #observations of the group being filled
+        self.count = 0
+
+    def _append(self, means):
+        needed = self.num_means + len(means)
+        if needed > len(self.means):
+            grown = np.zeros(max(needed, 2 * len(self.means)))
+            grown[:self.num_means] = self.means[:self.num_means]
+            self.means = grown
+        self.means[self.num_means:needed] = means
+        self.num_means = needed
+
+    def add(self, x):
+        self.count += 1
+        self.partial.append(x)
+        if len(self.partial) == self.batch_size:
+            self._append([sum(self.partial) / self.batch_size])
+            self.partial = []
+
+    def add_many(self, values):
+        values = np.concatenate([self.partial, np.asarray(values, dtype=float)])
+        self.count += len(values) - len(self.partial)
+        full = len(values) - len(values) % self.batch_size
+        if full:
+            self._append(values[:full].reshape(-1, self.batch_size).mean(axis=1))
+        self.partial = values[full:].tolist()
+
+    #Group means in observation order, the incomplete last group is left out
+    def series(self):
+        return self.means[:self.num_means]
+
+#MSER truncation point of a series (in elements of the series): the d minimizing the squared standard error
+#of the mean of series[d:], searched over the first half of the series as MSER recommends
+def mser_truncation(series):
+    series = np.asarray(series, dtype=float)
+    n = len(series)
+    if n < 4:
+        return 0
+    suffix_sum = np.cumsum(series[::-1])[::-1]
+    suffix_squares = np.cumsum((series * series)[::-1])[::-1]
+    remaining = n - np.arange(n)
+    squared_errors = suffix_squares - suffix_sum * suffix_sum / remaining
+    mser = squared_errors / (remaining * remaining)
+    return int(np.argmin(mser[:n // 2 + 1]))
+
+#Non-overlapping batch means of series: the last num_batches * k elements are split into num_batches batches
+#of k (any leftover is dropped at the start, next to the warm-up). Returns (mean, half-width, num_batches).
+def batch_means_interval(series, num_batches=20, confidence=0.95):
+    series = np.asarray(series, dtype=float)
+    num_batches = min(num_batches, len(series))
+    if num_batches == 0:
+        return np.nan, np.nan, 0
+    k = len(series) // num_batches
+    batches = series[len(series) - num_batches * k:].reshape(num_batches, k).mean(axis=1)
+    stats = RunningStats()
+    stats.add_many(batches)
+    return stats.mean, stats.half_width(confidence), num_batches
+
+#Steady-state estimate from one long run: MSER-5 warm-up truncation followed by batch means
+#Returns a dict with the mean, its confidence half-width, the observations discarded as warm-up,
+#the observations used and the number of batches
+def steady_state(batch_series, num_batches=20, confidence=0.95):
+    series = batch_series.series()
+    truncation = mser_truncation(series)
+    mean, half_width, batches = batch_means_interval(series[truncation:], num_batches, confidence)
+    return {
+        "mean": mean,
+        "half_width": half_width,
+        "warmup": truncation * batch_series.batch_size,
+        "observations": (len(series) - truncation) * batch_series.batch_size,
+        "batches": batches,
+    }
@@ -0,0 +1,45 @@
+import sys
+import time
+from event_engine import Environment
+from parallel_runner import replication_seeds
+from task_loader import load_task
+
+#Wraps an engine class so every environment it creates is kept, to read the event counts afterwards
+class EnvironmentLog:
+    def __init__(self, engine_class):
+        self.engine_class = engine_class
+        self.environments = []
+
+    def __call__(self, initial_time=0.0):
+        env = self.engine_class(initial_time)
+        self.environments.append(env)
+        return env
+
+#Events per second of each backend on the Task 2B2 configurations (n_b x strategy), same seeds for both
+#Both backends run the identical trajectory, so the events (process resumptions) counted by the heapq
+#engine are the event count of the SimPy run as well, and SimPy is timed without any instrumentation
+def benchmark(nb_values=(5, 7, 10, 15), strategies=("demand", "random"), num_runs=10, arrivals="process", seed=2024):
+    task = load_task("Task 2B2")
+    task.run_replication(nb_values[0], strategies[0], seed, arrivals=arrivals)  #warm-up, so imports and caches are not timed
+    rows = []
+    for strategy in strategies:
+        seeds = replication_seeds(seed, len(nb_values), num_runs)
+        for n_b, config_seeds in zip(nb_values, seeds):
+            elapsed = {}
+            for engine_name, engine in [("simpy", "simpy"), ("heapq", EnvironmentLog(Environment))]:
+                start = time.perf_counter()
+                for run_seed in config_seeds:
+                    task.run_replication(n_b, strategy, run_seed, arrivals=arrivals, engine=engine)
+                elapsed[engine_name] = time.perf_counter() - start
+            events = sum(env.events for env in engine.environments)
+            rows.append({"n_b": n_b, "strategy": strategy, "events": events,
+                         "simpy": events / elapsed["simpy"], "heapq": events / elapsed["heapq"]})
+    return rows
+
+if __name__ == "__main__":
+    num_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    arrivals = sys.argv[2] if len(sys.argv) > 2 else "process"
+    print(f"Task 2B2, {num_runs} replications per configuration, arrivals={arrivals}")
+    print(f"{'n_b':>4} {'strategy':>8} {'simpy ev/s':>12} {'heapq ev/s':>12} {'speed-up':>9}")
+    for row in benchmark(num_runs=num_runs, arrivals=arrivals):
+        print(f"{row['n_b']:>4} {row['strategy']:>8} {row['simpy']:>12.0f} {row['heapq']:>12.0f} {row['heapq'] / row['simpy']:>8.2f}x")
@@ -0,0 +1,168 @@
+import argparse
+import contextlib
+import json
+import platform
+import random
+import time
+import tracemalloc
+import numpy as np
+from benchmark_engines import EnvironmentLog
+from event_engine import Environment
+from network import use_network
+from network_generator import city_network
+from parallel_runner import replication_seeds
+from task_loader import load_task
+
+TASKS = ["Task 2A3 and 2A4", "Task 2A5", "Task 2B1", "Task 2B2"]
+
+#Base case and the values each scan moves away from it, one parameter at a time
+#num_stops None is the Lab 1 network, a number a generated network_generator.city_network of that size
+#Generated networks have uniform destinations (use_network refuses OD_WEIGHTS), so the destination sampler is O(n)
+#to set up and the num_stops scan times the bus model rather than per-replication setup
+BASE = {"n_b": 5, "lambda_value": None, "horizon": 100, "num_stops": None}
+SCANS = {
+    "n_b": [5, 10, 20, 40],
+    "lambda_value": [0.5, 1, 2, 3, 4, 10, 25, 50],
+    "horizon": [100, 200, 400, 800],
+    "num_stops": [100, 1000, 4000],
+}
+DEFAULT_LAMBDA = 1  #Task 2B1 has no per-stop rates of its own, its base case uses this lambda
+NETWORK_SEED = 2024  #seed of the generated networks, so every run of the suite times the same ones
+
+#Sets a task's horizon and (if lambda_value is given) every stop's arrival rate in its NETWORK for the duration of the block
+@contextlib.contextmanager
+def model_settings(task, lambda_value, horizon):
+    saved_time = task.SIMULATION_TIME
+    saved_rates = task.NETWORK.arrival_rates.copy()
+    task.SIMULATION_TIME = horizon
+    if lambda_value is not None:
+        task.NETWORK.arrival_rates[:] = lambda_value  #Task 2B1 ignores the network's rates, replicate passes it lambda_value
+    try:
+        yield
+    finally:
+        task.SIMULATION_TIME = saved_time
+        task.NETWORK.arrival_rates[:] = saved_rates
+
+#One replication of a task's model, the way its run_simulation runs them
+def replicate(name, task, n_b, lambda_value, seed, engine):
+    if name == "Task 2A3 and 2A4":
+        random.seed(int(seed.generate_state(1)[0]))  #the counting model draws from the global random module
+        task.run_simulation([n_b], 1, engine=engine)
+    elif name == "Task 2A5":
+        task.run_replication(n_b, seed, engine=engine)
+    elif name == "Task 2B1":
+        task.run_replication(n_b, DEFAULT_LAMBDA if lambda_value is None else lambda_value, seed, engine=engine)
+    else:
+        task.run_replication(n_b, "demand", seed, engine=engine)
+
+#Runs the task on a generated network of num_stops stops for the duration of the block, or on its own for None
+def network_settings(task, num_stops):
+    if num_stops is None:
+        return contextlib.nullcontext()
+    return use_network(task, city_network(num_stops, NETWORK_SEED))
+
+#Events per second, median wall time per replication and peak traced memory of one case, over num_runs seeded replications
+#Events are counted on the heapq engine (same trajectory as SimPy); with engine="simpy" the timed runs are
+#uninstrumented and the counting runs are separate. Peak memory comes from one more run under tracemalloc.
+def measure(name, n_b, lambda_value, horizon, num_runs=3, engine="simpy", seed=2024, num_stops=None):
+    task = load_task(name)
+    seeds = replication_seeds(seed, 1, num_runs)[0]
+    counter = EnvironmentLog(Environment)
+    with network_settings(task, num_stops), model_settings(task, lambda_value, horizon):
+        replicate(name, task, n_b, lambda_value, seeds[0], engine)  #warm-up, so imports and caches are not timed
+
+        times = []
+        for run_seed in seeds:
+            start = time.perf_counter()
+            replicate(name, task, n_b, lambda_value, run_seed, counter if engine == "heapq" else engine)
+            times.append(time.perf_counter() - start)
+        elapsed = sum(times)
+        if engine != "heapq":
+            for run_seed in seeds:
+                replicate(name, task, n_b, lambda_value, run_seed, counter)
+        events = sum(env.events for env in counter.environments[-num_runs:])
+
+        tracemalloc.start()
+        replicate(name, task, n_b, lambda_value, seeds[0], engine)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "task": name, "n_b": n_b, "lambda_value": lambda_value, "horizon": horizon, "num_stops": num_stops, "engine": engine,
+        "events_per_replication": events / num_runs,
+        "events_per_second": events / elapsed,
+        "seconds_per_replication": float(np.median(times)),  #the median is less sensitive to one-off stalls
+        "peak_memory_bytes": peak,
+    }
+
+#Every case of the suite: the base case of each task plus the n_b, lambda, horizon and network size scans
+def cases(tasks=TASKS, scans=SCANS):
+    seen = []
+    for name in tasks:
+        for parameter, values in scans.items():
+            for value in values:
+                case = dict(BASE, task=name, **{parameter: value})
+                if case not in seen:
+                    seen.append(case)
+    return seen
+
+def run_suite(tasks=TASKS, num_runs=3, engine="simpy", seed=2024):
+    return [measure(case["task"], case["n_b"], case["lambda_value"], case["horizon"], num_runs, engine, seed, case["num_stops"])
+            for case in cases(tasks)]
+
+#Baseline file: the measurements plus enough about the machine to tell whether two files are comparable
+def save_results(path, rows):
+    meta = {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "processor": platform.processor(), "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+    with open(path, "w") as file:
+        json.dump({"meta": meta, "results": rows}, file, indent=1)
+
+def load_results(path):
+    with open(path) as file:
+        return json.load(file)["results"]
+
+def case_key(row):
+    return row["task"], row["n_b"], row["lambda_value"], row["horizon"], row.get("num_stops"), row["engine"]  #baselines from before the network scan have no num_stops
+
+#Time per replication relative to the baseline for every case both runs have, flagged when it got slower than threshold
+def compare(rows, baseline, threshold=0.10):
+    previous = {case_key(row): row for row in baseline}
+    comparison = []
+    for row in rows:
+        old = previous.get(case_key(row))
+        if old is None:
+            continue
+        ratio = row["seconds_per_replication"] / old["seconds_per_replication"]
+        comparison.append(dict(row, baseline_seconds=old["seconds_per_replication"], ratio=ratio, regression=ratio > 1 + threshold))
+    return comparison
+
+def print_rows(rows):
+    print(f"{'task':<17} {'n_b':>4} {'lambda':>6} {'horizon':>7} {'stops':>6} {'events/s':>11} {'s/rep':>9} {'peak MB':>8}")
+    for row in rows:
+        lambda_value = "-" if row["lambda_value"] is None else row["lambda_value"]
+        num_stops = "-" if row.get("num_stops") is None else row["num_stops"]
+        line = (f"{row['task']:<17} {row['n_b']:>4} {lambda_value:>6} {row['horizon']:>7} {num_stops:>6} {row['events_per_second']:>11.0f} "
+                f"{row['seconds_per_replication']:>9.4f} {row['peak_memory_bytes'] / 2 ** 20:>8.2f}")
+        if "ratio" in row:
+            line += f" {row['ratio']:>6.2f}x" + ("  REGRESSION" if row["regression"] else "")
+        print(line)
+
+#Usage: python benchmark_suite.py [--runs N] [--engine simpy|heapq] [--task NAME ...] [--save FILE] [--compare FILE]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and scaling benchmarks of the bus models")
+    parser.add_argument("--runs", type=int, default=3, help="replications per case")
+    parser.add_argument("--engine", default="simpy", choices=["simpy", "heapq"])
+    parser.add_argument("--task", action="append", choices=TASKS, help="only these scripts (repeatable)")
+    parser.add_argument("--save", help="write the results to this JSON baseline")
+    parser.add_argument("--compare", help="compare against this JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slow-down reported as a regression")
+    args = parser.parse_args()
+
+    rows = run_suite(args.task or TASKS, args.runs, args.engine)
+    if args.compare:
+        rows = compare(rows, load_results(args.compare), args.threshold)
+    print_rows(rows)
+    if args.save:
+        save_results(args.save, rows)
+    if args.compare and any(row["regression"] for row in rows):
+        raise SystemExit(1)
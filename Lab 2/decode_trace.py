@@ -0,0 +1,13 @@
+import sys
+from event_trace import format_record, read_trace
+
+#Prints a binary trace written by event_trace.Tracer(path=...) as readable lines
+#Usage: python decode_trace.py trace.bin [max_lines]
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python decode_trace.py trace.bin [max_lines]")
+
+    records, names = read_trace(sys.argv[1])
+    max_lines = int(sys.argv[2]) if len(sys.argv) > 2 else len(records)
+    for record in records[:max_lines]:
+        print(format_record(record, names))
@@ -0,0 +1,56 @@
+import numpy as np
+
+#Walker/Vose alias table for one discrete distribution: O(n) to build, O(1) per draw
+def alias_table(weights):
+    weights = np.asarray(weights, dtype=float)
+    n = len(weights)
+    scaled = weights * n / weights.sum()
+    prob = np.zeros(n)
+    alias = np.arange(n)
+    small = [i for i in range(n) if scaled[i] < 1]
+    large = [i for i in range(n) if scaled[i] >= 1]
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] = scaled[l] + scaled[s] - 1
+        (small if scaled[l] < 1 else large).append(l)
+    for i in small + large:  #leftovers are 1 up to rounding
+        prob[i] = 1.0
+    return prob, alias
+
+#Destination stop ids for passengers, one alias table per origin stop built once per run
+#weights is an n x n origin-destination matrix indexed by stop id (the diagonal is ignored);
+#None means uniform over every other stop, drawn without tables as one of the n - 1 other ids, so setup stays
+#O(n) on large networks. rng is one generator or a list of them, one per origin.
+#draw_many is fully vectorized, draw hands out
+#single destinations from per-origin blocks of block_size draws.
+class DestinationSampler:
+    def __init__(self, num_stops, rng, weights=None, block_size=256):
+        self.uniform = weights is None
+        if not self.uniform:
+            weights = np.array(weights, dtype=float)
+            np.fill_diagonal(weights, 0.0)  #Ensure the destination is different from the origin
+            tables = [alias_table(row) for row in weights]
+            self.prob = np.array([prob for prob, _ in tables])
+            self.alias = np.array([alias for _, alias in tables])
+        self.num_stops = num_stops
+        self.rngs = list(rng) if isinstance(rng, (list, tuple)) else [rng] * num_stops
+        self.block_size = block_size
+        self.blocks = [[] for _ in range(num_stops)]
+
+    def draw_many(self, origin, n):
+        rng = self.rngs[origin]
+        if self.uniform:
+            others = rng.integers(self.num_stops - 1, size=n)
+            return others + (others >= origin)  #skip over the origin
+        columns = rng.integers(self.num_stops, size=n)
+        keep = rng.random(n) < self.prob[origin, columns]
+        return np.where(keep, columns, self.alias[origin, columns])
+
+    def draw(self, origin):
+        block = self.blocks[origin]
+        if not block:
+            block.extend(self.draw_many(origin, self.block_size).tolist()[::-1])
+        return block.pop()
@@ -0,0 +1,50 @@
+import heapq
+
+#Minimal event engine covering the part of SimPy the bus models use: now, process(), timeout() and run(until)
+#The calendar is a heapq of (time, seq, process) entries. A process is the same generator the SimPy
+#backend runs (bus, passenger_generator), i.e. a state machine resumed at each of its event times.
+#timeout() just returns the delay, so there are no Event objects or callbacks per step.
+#Ties are broken by scheduling order and run(until) stops before events at exactly until, like SimPy,
+#so for the same random draws both backends give the same trajectory.
+class Environment:
+    def __init__(self, initial_time=0.0):
+        self.now = initial_time
+        self.queue = []
+        self.seq = 0
+        self.events = 0  #events processed so far, for benchmarking
+
+    def timeout(self, delay):
+        return delay
+
+    def process(self, generator):
+        heapq.heappush(self.queue, (self.now, self.seq, generator))
+        self.seq += 1
+        return generator
+
+    def run(self, until):
+        queue = self.queue
+        heappop = heapq.heappop
+        heappush = heapq.heappush
+        events = 0
+        while queue and queue[0][0] < until:
+            time, _, generator = heappop(queue)
+            self.now = time
+            events += 1
+            try:
+                delay = next(generator)
+            except StopIteration:
+                continue
+            heappush(queue, (time + delay, self.seq, generator))
+            self.seq += 1
+        self.now = until
+        self.events += events
+
+#Environment for a backend name: "simpy", "heapq", or an Environment-like class (e.g. an instrumented one)
+#initial_time starts the clock later, e.g. when a run resumes from a snapshot
+def make_environment(engine="simpy", initial_time=0.0):
+    if engine == "simpy":
+        import simpy
+        return simpy.Environment(initial_time)
+    if engine == "heapq":
+        return Environment(initial_time)
+    return engine(initial_time)
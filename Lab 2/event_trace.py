@@ -0,0 +1,114 @@
+import json
+import struct
+
+#Trace levels
+OFF = 0
+STOPS = 1  #bus arrivals, boarding/alighting counts, occupancy and route switches
+PASSENGERS = 2  #everything in STOPS plus one record per passenger arrival, boarding and alighting
+
+#Record kinds and what the a/b fields hold
+PASSENGER_ARRIVED = 1  #a=stop, b=passenger id (-1 when passengers have no identity)
+BUS_ARRIVED = 2  #a=stop
+PASSENGERS_LEFT = 3  #a=stop, b=count
+PASSENGERS_BOARDED = 4  #a=stop, b=count
+PASSENGER_LEFT = 5  #a=stop, b=passenger id
+PASSENGER_BOARDED = 6  #a=stop, b=passenger id
+BUS_OCCUPANCY = 7  #a=occupancy, b=capacity
+ROUTE_SWITCH = 8  #a=route
+NO_ROUTE = 9  #a=terminal
+
+#kind, time, a, b packed little-endian without padding (17 bytes)
+RECORD = struct.Struct("<Bdii")
+
+#Compact event trace for the bus and passenger processes
+#Records go into a preallocated bytearray. Without a path it is a ring buffer keeping the newest
+#capacity records; with a path the buffer is written to the file in bulk whenever it fills up.
+#Stop and route names are stored once in a name table and referenced by id in the records.
+class Tracer:
+    def __init__(self, level=STOPS, capacity=65536, path=None):
+        self.level = level
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.next = 0
+        self.count = 0
+        self.dropped = 0
+        self.names = []
+        self.name_ids = {}
+        self.path = path
+        self.file = open(path, "wb") if path is not None else None
+
+    def enabled(self, level):
+        return self.level >= level
+
+    def name_id(self, name):
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def emit(self, kind, time, a=0, b=0):
+        if self.count == self.capacity:
+            if self.file is not None:
+                self.flush()
+            else:
+                self.dropped += 1
+                self.count -= 1
+        RECORD.pack_into(self.buffer, self.next * RECORD.size, kind, time, a, b)
+        self.next = (self.next + 1) % self.capacity
+        self.count += 1
+
+    #Buffered records, oldest first, as (kind, time, a, b) tuples
+    def records(self):
+        start = (self.next - self.count) % self.capacity
+        data = self.buffer[start * RECORD.size:] + self.buffer[:start * RECORD.size]
+        return list(RECORD.iter_unpack(bytes(data[:self.count * RECORD.size])))
+
+    def flush(self):
+        if self.file is None:
+            return
+        self.file.write(memoryview(self.buffer)[:self.count * RECORD.size])
+        self.next = 0
+        self.count = 0
+
+    #Writes the remaining records and the name table (to path + ".names.json")
+    def close(self):
+        if self.file is None:
+            return
+        self.flush()
+        self.file.close()
+        self.file = None
+        with open(self.path + ".names.json", "w") as names_file:
+            json.dump(self.names, names_file)
+
+#Reads a trace file written by Tracer, returns (records, names)
+def read_trace(path):
+    with open(path + ".names.json") as names_file:
+        names = json.load(names_file)
+    with open(path, "rb") as trace_file:
+        records = list(RECORD.iter_unpack(trace_file.read()))
+    return records, names
+
+#Human-readable line for one record, in the same wording the scripts used to print
+def format_record(record, names):
+    kind, time, a, b = record
+    if kind == PASSENGER_ARRIVED:
+        passenger = "Passenger" if b < 0 else f"Passenger {b}"
+        return f"{passenger} arrived at {names[a]} at time {time}"
+    if kind == BUS_ARRIVED:
+        return f"Bus arriving at {names[a]} at time {time}"
+    if kind == PASSENGERS_LEFT:
+        return f"{b} passengers left the bus at {names[a]} at time {time}"
+    if kind == PASSENGERS_BOARDED:
+        return f"{b} passengers boarded the bus at {names[a]} at time {time}"
+    if kind == PASSENGER_LEFT:
+        return f"Passenger {b} left the bus at {names[a]} at time {time}"
+    if kind == PASSENGER_BOARDED:
+        return f"Passenger {b} boarded the bus at {names[a]} at time {time}"
+    if kind == BUS_OCCUPANCY:
+        return f"Bus capacity now: {a}/{b}"
+    if kind == ROUTE_SWITCH:
+        return f"Bus switching to a new route: {names[a]} at time {time}"
+    if kind == NO_ROUTE:
+        return f"No connecting route found from {names[a]}. Continuing with the current route."
+    return f"Unknown record kind {kind} at time {time}: {a} {b}"
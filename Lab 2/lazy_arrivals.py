@@ -0,0 +1,72 @@
+import numpy as np
+
+#Poisson arrival times for one stop, drawn in vectorized blocks of exponential inter-arrival times
+class ArrivalStream:
+    def __init__(self, rate, rng, block_size=256, start_time=0.0):
+        self.rate = rate
+        self.rng = rng
+        self.block_size = block_size
+        self.times = np.empty(0)
+        self.pos = 0
+        self.last_time = start_time
+        self._refill()
+
+    def _refill(self):
+        block = self.last_time + np.cumsum(self.rng.exponential(1 / self.rate, self.block_size))
+        self.last_time = block[-1]
+        self.times = block
+        self.pos = 0
+
+    #Time of the next arrival that has not been handed out yet
+    def next_time(self):
+        return self.times[self.pos]
+
+    #Hands out every arrival time up to and including now, oldest first
+    def pop_until(self, now):
+        chunks = []
+        while True:
+            end = int(np.searchsorted(self.times, now, side="right"))
+            chunks.append(self.times[self.pos:end])
+            if end < len(self.times):
+                self.pos = end
+                break
+            self._refill()
+        return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+#Bus stop queue that only turns pending arrivals into queue entries when someone looks at it
+#make_entries(arrival_times) turns a block of arrival times into queue entries (e.g. passenger rows),
+#in arrival order; without make_entries the arrival times go into queue as they are
+class LazyStopQueue:
+    def __init__(self, env, stream, queue, make_entries=None):
+        self.env = env
+        self.stream = stream
+        self.queue = queue
+        self.make_entries = make_entries
+
+    def catch_up(self):
+        if self.stream.next_time() <= self.env.now:
+            arrival_times = self.stream.pop_until(self.env.now)
+            if self.make_entries is None:
+                self.queue.extend(arrival_times)
+            else:
+                self.queue.extend(self.make_entries(arrival_times))
+
+    def __len__(self):
+        self.catch_up()
+        return len(self.queue)
+
+    def __iter__(self):
+        self.catch_up()
+        return iter(self.queue)
+
+    def append(self, entry):
+        self.catch_up()
+        self.queue.append(entry)
+
+    def extend(self, entries):
+        self.catch_up()
+        self.queue.extend(entries)
+
+    def take(self, k):
+        self.catch_up()
+        return self.queue.take(k)
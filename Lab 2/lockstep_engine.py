@@ -0,0 +1,101 @@
+import numpy as np
+
+#Counting bus model (Task 2A3) for R replications at once: every state variable is an (R, ...) array and each step
+#advances every unfinished replication by one event, the arrival of its earliest bus at the end of a road.
+#Travel times are fixed, so a bus's next event time is known when it sets off and no event queue is needed.
+#Passengers have no identity, a stop only holds a count: arrivals are added lazily as a Poisson increment
+#over the time since the stop was last looked at (the same distribution as a Poisson process per stop), when a bus
+#visits it and, for every stop, when a bus picks its next route. Alighting is binomial(occ, prob_leave) and the
+#route switch takes the connecting route with the most passengers waiting (the first on ties, none if nobody
+#waits), as RouteDemand.busiest. Buses of one replication due at the same time are served in the order their
+#events were scheduled, as SimPy does. Results agree with the process model in distribution, not draw for draw.
+class LockstepCountingModel:
+    def __init__(self, network, capacity, prob_leave):
+        self.network = network
+        self.capacity = capacity
+        self.prob_leave = prob_leave
+        num_routes = network.num_routes
+        max_legs = max(len(leg_times) for leg_times in network.leg_times_of)
+
+        #Per-route legs padded to max_legs: the stop reached at the end of each leg (-1 for none) and its travel time
+        self.num_legs = np.array([len(leg_times) for leg_times in network.leg_times_of], dtype=np.int64)
+        self.leg_stop = np.full((num_routes, max_legs), -1, dtype=np.int64)
+        self.leg_time = np.zeros((num_routes, max_legs))
+        for route in range(num_routes):
+            stops = network.stops_of[route]
+            self.leg_stop[route, :len(stops)] = stops
+            self.leg_time[route, :self.num_legs[route]] = network.leg_times_of[route]
+
+        #Stops served per route (with multiplicity, as RouteDemand counts them) and the routes leaving each route's end
+        self.route_stops = np.zeros((num_routes, network.num_stops))
+        for route in range(num_routes):
+            np.add.at(self.route_stops[route], network.stops_of[route], 1)
+        connections = [network.routes_from.get(end, []) for end in network.end_of]
+        self.next_routes = np.full((num_routes, max(1, max(len(routes) for routes in connections))), -1, dtype=np.int64)
+        for route, routes in enumerate(connections):
+            self.next_routes[route, :len(routes)] = routes
+
+    #Runs num_runs replications of n_b buses up to horizon (events at exactly horizon are not processed, as env.run)
+    #Returns per replication the mean utilization over stop visits and the time-average fleet occupancy
+    def run(self, n_b, num_runs, horizon, rng):
+        rates = self.network.arrival_rates
+        rows = np.arange(num_runs)
+        waiting = np.zeros((num_runs, self.network.num_stops), dtype=np.int64)
+        last_seen = np.zeros((num_runs, self.network.num_stops))
+        route = rng.integers(self.network.num_routes, size=(num_runs, n_b))
+        leg = np.zeros((num_runs, n_b), dtype=np.int64)
+        occ = np.zeros((num_runs, n_b), dtype=np.int64)
+        next_time = self.leg_time[route, 0]
+        scheduled = np.tile(np.arange(n_b), (num_runs, 1))  #scheduling order of each bus's pending event, breaks ties
+        sequence = np.full(num_runs, n_b)
+        utilization_sum = np.zeros(num_runs)
+        visits = np.zeros(num_runs, dtype=np.int64)
+        fleet_occ = np.zeros(num_runs, dtype=np.int64)
+        occ_area = np.zeros(num_runs)
+        last_change = np.zeros(num_runs)
+
+        while True:
+            now = next_time.min(axis=1)
+            bus = np.argmin(np.where(next_time == now[:, None], scheduled, np.iinfo(np.int64).max), axis=1)
+            active = now < horizon
+            if not active.any():
+                break
+            r, b, t = rows[active], bus[active], now[active]
+            bus_route, bus_leg = route[r, b], leg[r, b]
+
+            #Stop visit: catch the stop up, drop off, pick up, record the utilization
+            stop = self.leg_stop[bus_route, bus_leg]
+            at_stop = stop >= 0
+            vr, vb, vt, vs = r[at_stop], b[at_stop], t[at_stop], stop[at_stop]
+            waiting[vr, vs] += rng.poisson(rates[vs] * (vt - last_seen[vr, vs]))
+            last_seen[vr, vs] = vt
+            on_board = occ[vr, vb]
+            leaving = rng.binomial(on_board, self.prob_leave)
+            boarding = np.minimum(waiting[vr, vs], self.capacity - (on_board - leaving))
+            waiting[vr, vs] -= boarding
+            occ[vr, vb] = on_board - leaving + boarding
+            utilization_sum[vr] += occ[vr, vb] / self.capacity
+            visits[vr] += 1
+            occ_area[vr] += fleet_occ[vr] * (vt - last_change[vr])
+            fleet_occ[vr] += boarding - leaving
+            last_change[vr] = vt
+
+            #End of the route: catch every stop up and switch to the busiest connecting route, if anyone waits
+            leg[r, b] = bus_leg + 1
+            done = leg[r, b] == self.num_legs[bus_route]
+            sr, sb, st, old_route = r[done], b[done], t[done], bus_route[done]
+            waiting[sr] += rng.poisson(rates * (st[:, None] - last_seen[sr]))
+            last_seen[sr] = st[:, None]
+            candidates = self.next_routes[old_route]
+            demand = np.where(candidates >= 0, (waiting[sr] @ self.route_stops.T)[np.arange(len(sr))[:, None], candidates], -1)
+            best = np.argmax(demand, axis=1)
+            route[sr, sb] = np.where(demand[np.arange(len(sr)), best] > 0, candidates[np.arange(len(sr)), best], old_route)
+            leg[sr, sb] = 0
+
+            next_time[r, b] = t + self.leg_time[route[r, b], leg[r, b]]
+            scheduled[r, b] = sequence[r]
+            sequence[r] += 1
+
+        occ_area += fleet_occ * (horizon - last_change)
+        with np.errstate(invalid="ignore"):
+            return utilization_sum / visits, occ_area / horizon
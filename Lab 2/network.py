@@ -0,0 +1,135 @@
+import contextlib
+import csv
+import json
+import os
+import numpy as np
+from route_demand import outgoing_routes
+
+NETWORKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "networks")
+
+#Bus network compiled to integer ids: stops, roads, terminals and routes are numbered and the per-route data
+#are index arrays, so the models never look names up while they run. Names are only used on input
+#(the arrival_rates / travel_times / routes dicts of the original scripts) and output (stop_names, route_names...).
+#Stops are numbered in order of first appearance along the routes, which is the order the scripts always used.
+class Network:
+    def __init__(self, arrival_rates, travel_times, routes):
+        self.stop_names = list(dict.fromkeys([stop for route in routes.values() for stop in route["stops"]] + list(arrival_rates)))
+        self.stop_ids = {stop: stop_id for stop_id, stop in enumerate(self.stop_names)}
+        self.road_names = list(travel_times)
+        self.road_ids = {road: road_id for road_id, road in enumerate(self.road_names)}
+        self.terminal_names = list(dict.fromkeys(terminal for route in routes.values() for terminal in (route["start"], route["end"])))
+        self.terminal_ids = {terminal: terminal_id for terminal_id, terminal in enumerate(self.terminal_names)}
+        self.route_names = list(routes)
+        self.route_ids = {route: route_id for route_id, route in enumerate(self.route_names)}
+        self.num_stops = len(self.stop_names)
+        self.num_routes = len(self.route_names)
+
+        #Every stop needs a positive rate: the models start an arrival process at (or lazily catch up) every stop
+        #(Task 2B1 replaces the rates by its lambda, but still needs the network to be complete)
+        missing = [stop for stop in self.stop_names if not arrival_rates.get(stop, 0) > 0]
+        if missing:
+            raise ValueError(f"stops without a positive arrival rate: {', '.join(missing)}")
+        self.arrival_rates = np.array([arrival_rates[stop] for stop in self.stop_names], dtype=float)
+        self.rate_stops = [self.stop_ids[stop] for stop in arrival_rates]  #every stop, in the order the network lists their rates (the order Task 2A5 starts its arrival processes in)
+        self.travel_times = np.array([travel_times[road] for road in self.road_names], dtype=float)
+        self.route_start = np.array([self.terminal_ids[route["start"]] for route in routes.values()], dtype=np.int64)
+        self.route_end = np.array([self.terminal_ids[route["end"]] for route in routes.values()], dtype=np.int64)
+        self.route_stops = [np.array([self.stop_ids[stop] for stop in route["stops"]], dtype=np.int64) for route in routes.values()]
+        self.route_roads = [np.array([self.road_ids[road] for road in route["roads"]], dtype=np.int64) for route in routes.values()]
+        self.route_leg_times = [self.travel_times[roads] for roads in self.route_roads]
+
+        #Plain-list copies of the per-route arrays for the bus loops, which index one element per event
+        #(indexing a list from Python is several times cheaper than indexing a NumPy array)
+        self.stops_of = [stops.tolist() for stops in self.route_stops]
+        self.leg_times_of = [leg_times.tolist() for leg_times in self.route_leg_times]
+        self.end_of = self.route_end.tolist()
+        self.routes_from = outgoing_routes(self.route_table())
+
+    #Routes by id with terminal, stop and road ids, in the layout of the original routes dict
+    def route_table(self):
+        return {
+            route_id: {
+                "start": int(self.route_start[route_id]),
+                "end": int(self.route_end[route_id]),
+                "stops": self.stops_of[route_id],
+                "roads": self.route_roads[route_id].tolist(),
+            }
+            for route_id in range(self.num_routes)
+        }
+
+    #The network by name again, as the JSON file stores it
+    def to_dict(self):
+        return {
+            "arrival_rates": {self.stop_names[stop]: float(self.arrival_rates[stop]) for stop in self.rate_stops},
+            "travel_times": {road: float(time) for road, time in zip(self.road_names, self.travel_times)},
+            "routes": {
+                route: {
+                    "start": self.terminal_names[self.route_start[route_id]],
+                    "end": self.terminal_names[self.route_end[route_id]],
+                    "stops": [self.stop_names[stop] for stop in self.route_stops[route_id]],
+                    "roads": [self.road_names[road] for road in self.route_roads[route_id]],
+                }
+                for route_id, route in enumerate(self.route_names)
+            },
+        }
+
+#Loads a network from a .json file ({"arrival_rates", "travel_times", "routes"}, as in the scripts)
+#or from a directory of CSV files: stops.csv (stop,arrival_rate), roads.csv (road,travel_time) and
+#routes.csv (route,start,end,stops,roads) with the stops and roads of a route separated by spaces
+#A stop with a blank arrival_rate is reported as having none
+def load_network(path):
+    if os.path.isdir(path):
+        with open(os.path.join(path, "stops.csv"), newline="") as file:
+            arrival_rates = {row["stop"]: float(row["arrival_rate"]) for row in csv.DictReader(file) if row["arrival_rate"]}
+        with open(os.path.join(path, "roads.csv"), newline="") as file:
+            travel_times = {row["road"]: float(row["travel_time"]) for row in csv.DictReader(file)}
+        with open(os.path.join(path, "routes.csv"), newline="") as file:
+            routes = {row["route"]: {"start": row["start"], "end": row["end"], "stops": row["stops"].split(), "roads": row["roads"].split()}
+                      for row in csv.DictReader(file)}
+    else:
+        with open(path) as file:
+            data = json.load(file)
+        arrival_rates, travel_times, routes = data.get("arrival_rates", {}), data["travel_times"], data["routes"]
+    return Network(arrival_rates, travel_times, routes)
+
+#Writes a network in the format load_network reads: JSON for a path ending in .json, otherwise a CSV directory
+def save_network(network, path):
+    data = network.to_dict()
+    if path.endswith(".json"):
+        with open(path, "w") as file:
+            json.dump(data, file, indent=1)
+        return
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "stops.csv"), "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["stop", "arrival_rate"])
+        writer.writerows(data["arrival_rates"].items())
+    with open(os.path.join(path, "roads.csv"), "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["road", "travel_time"])
+        writer.writerows(data["travel_times"].items())
+    with open(os.path.join(path, "routes.csv"), "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["route", "start", "end", "stops", "roads"])
+        writer.writerows([route, route_data["start"], route_data["end"], " ".join(route_data["stops"]), " ".join(route_data["roads"])]
+                         for route, route_data in data["routes"].items())
+
+#Runs a task script's model on network for the duration of the block
+#The scripts keep their network, and what they derive from it, in module globals, which are swapped here
+#(replications on a process pool see the swap through fork, the default start method on Linux)
+@contextlib.contextmanager
+def use_network(task, network):
+    if getattr(task, "OD_WEIGHTS", None) is not None:
+        raise ValueError("OD_WEIGHTS are set for the task's own network")
+    derived = {
+        "NETWORK": network, "ROUTE_TABLE": network.route_table(), "ROUTES_FROM": network.routes_from,
+        "STOP_NAMES": network.stop_names,
+    }
+    saved = {name: getattr(task, name) for name in derived if hasattr(task, name)}
+    for name in saved:
+        setattr(task, name, derived[name])
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(task, name, value)
@@ -0,0 +1,107 @@
+import argparse
+import numpy as np
+from network import Network, save_network
+
+#Random bus network in the shape of the Lab 1 network, reproducible from seed
+#Terminals (E1, E2...) and stations are points in the unit square; every station has an east and a west stop
+#(S1_e, S1_w...). Routes come in east/west pairs between two terminals: the first num_terminals - 1 pairs
+#connect the terminals into a tree, so a bus can reach every terminal, the others join random distinct terminals.
+#Every station is served by the route pair passing closest to it, and each pair also serves its
+#overlap * (stations per pair) nearest other stations, so routes share stops as in Lab 1. A route visits its
+#stations in order along the line between its terminals and roads between two points are shared by both directions.
+#Travel times are the road lengths scaled to mean_travel_time and rounded to whole minutes (at least 1),
+#arrival rates are uniform over rate_range.
+def generate_network(num_stops, num_routes, num_terminals, seed=None, overlap=0.2, mean_travel_time=5, rate_range=(0.1, 0.9)):
+    if num_stops % 2 or num_routes % 2:
+        raise ValueError("Stops and routes come in east/west pairs, num_stops and num_routes must be even")
+    num_stations = num_stops // 2
+    num_pairs = num_routes // 2
+    if num_terminals < 2 or not num_terminals - 1 <= num_pairs <= num_terminals * (num_terminals - 1) // 2:
+        raise ValueError(f"{num_routes} routes cannot connect {num_terminals} terminals with distinct terminal pairs")
+
+    rng = np.random.default_rng(seed)
+    terminals = rng.random((num_terminals, 2))
+    stations = rng.random((num_stations, 2))
+
+    #Terminal pairs of the routes, a spanning tree first
+    pairs = [(int(rng.integers(i)), i) for i in range(1, num_terminals)]
+    used = set(pairs)
+    while len(pairs) < num_pairs:
+        pair = tuple(sorted(rng.choice(num_terminals, 2, replace=False).tolist()))
+        if pair not in used:
+            used.add(pair)
+            pairs.append(pair)
+
+    #Position of every station along every pair's line (0 at the start terminal, 1 at the end) and its distance to it
+    start = terminals[[a for a, _ in pairs]]
+    direction = terminals[[b for _, b in pairs]] - start
+    offsets = stations[:, None, :] - start[None, :, :]
+    position = (offsets * direction).sum(axis=2) / (direction * direction).sum(axis=1)
+    distance = np.linalg.norm(offsets - np.clip(position, 0, 1)[:, :, None] * direction, axis=2)
+
+    members = [set() for _ in pairs]
+    for station, pair in enumerate(np.argmin(distance, axis=1).tolist()):
+        members[pair].add(station)
+    shared = min(int(round(overlap * num_stations / num_pairs)), num_stations - 1)
+    if shared > 0:
+        for pair, nearest in enumerate(np.argpartition(distance, shared, axis=0)[:shared].T):
+            members[pair].update(nearest.tolist())
+
+    #Roads between consecutive points of every route, nodes 0..num_terminals-1 are the terminals and the rest the stations
+    points = np.vstack([terminals, stations])
+    road_ids = {}
+    paths = []
+    for pair, (a, b) in enumerate(pairs):
+        served = np.array(sorted(members[pair]), dtype=np.int64)
+        served = served[np.argsort(position[served, pair], kind="stable")]
+        path = [a] + (served + num_terminals).tolist() + [b]
+        paths.append((served.tolist(), [road_ids.setdefault((min(u, v), max(u, v)), len(road_ids)) for u, v in zip(path, path[1:])]))
+    lengths = np.array([np.linalg.norm(points[u] - points[v]) for u, v in road_ids])
+    minutes = np.maximum(np.rint(lengths * mean_travel_time / lengths.mean()), 1).astype(int)
+    travel_times = {f"R{road + 1}": int(minutes[road]) for road in range(len(road_ids))}
+
+    routes = {}
+    for (a, b), (served, roads) in zip(pairs, paths):
+        road_names = [f"R{road + 1}" for road in roads]
+        routes[f"Route_E{a + 1}_E{b + 1}_east"] = {
+            "start": f"E{a + 1}", "end": f"E{b + 1}",
+            "stops": [f"S{station + 1}_e" for station in served], "roads": road_names,
+        }
+        routes[f"Route_E{a + 1}_E{b + 1}_west"] = {
+            "start": f"E{b + 1}", "end": f"E{a + 1}",
+            "stops": [f"S{station + 1}_w" for station in reversed(served)], "roads": road_names[::-1],
+        }
+
+    rates = rng.uniform(*rate_range, size=(num_stations, 2))
+    arrival_rates = {}
+    for station in range(num_stations):
+        arrival_rates[f"S{station + 1}_e"] = float(rates[station, 0])
+        arrival_rates[f"S{station + 1}_w"] = float(rates[station, 1])
+    return Network(arrival_rates, travel_times, routes)
+
+#Network of num_stops stops (even) in roughly city proportions: about 10 stops per route and 5 routes per terminal
+def city_network(num_stops, seed=None):
+    num_routes = max(2, 2 * round(num_stops / 20))
+    num_pairs = num_routes // 2
+    num_terminals = max(2, num_routes // 5)
+    while num_terminals * (num_terminals - 1) // 2 < num_pairs:
+        num_terminals += 1
+    return generate_network(num_stops, num_routes, num_terminals, seed)
+
+#Usage: python network_generator.py PATH --stops N [--routes N --terminals N] [--seed N]
+#PATH ending in .json writes a JSON file, anything else a directory of CSV files (see network.load_network)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a random bus network")
+    parser.add_argument("path")
+    parser.add_argument("--stops", type=int, required=True, help="number of stops (even)")
+    parser.add_argument("--routes", type=int, help="number of routes (even), city proportions if not given")
+    parser.add_argument("--terminals", type=int, help="number of terminals, city proportions if not given")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.routes is None or args.terminals is None:
+        network = city_network(args.stops, args.seed)
+    else:
+        network = generate_network(args.stops, args.routes, args.terminals, args.seed)
+    save_network(network, args.path)
+    print(f"{network.num_stops} stops, {len(network.road_names)} roads, {len(network.terminal_names)} terminals, {network.num_routes} routes")
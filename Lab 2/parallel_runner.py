@@ -0,0 +1,27 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+#Independent, reproducible RNG streams, one per (config, replication) pair
+#The same seed always gives the same streams, no matter how the replications are scheduled
+def replication_seeds(seed, num_configs, num_runs):
+    root = np.random.SeedSequence(seed)
+    return [config_seed.spawn(num_runs) for config_seed in root.spawn(num_configs)]
+
+#Runs replicate(*task) for every task, either one by one (workers=1) or on a process pool
+#Results come back in the same order as the tasks, so the serial and parallel paths give identical output
+def run_replications(replicate, tasks, workers=1):
+    if workers == 1 or len(tasks) <= 1:
+        return [replicate(*task) for task in tasks]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(tasks))
+    chunksize = max(1, len(tasks) // (4 * workers))  #a few chunks per worker keeps the pool busy without much IPC
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(replicate, *zip(*tasks), chunksize=chunksize))
+
+#Flattens the per-config seeds into (config, seed) tasks for run_replications
+def replication_tasks(configs, seeds):
+    return [(*config, run_seed) for config, config_seeds in zip(configs, seeds) for run_seed in config_seeds]
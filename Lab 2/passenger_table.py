@@ -0,0 +1,103 @@
+import numpy as np
+
+#Column name -> dtype of the passenger table
+COLUMNS = {
+    "passenger_id": np.int64,
+    "origin": np.int32,
+    "destination": np.int32,
+    "arrival_time": np.float64,
+    "boarding_time": np.float64,
+    "alighting_time": np.float64,
+}
+
+#Struct-of-arrays passenger store: one NumPy column per field, a passenger is an integer row id
+#Rows of passengers who finished their trip are recycled, so memory follows the number of passengers
+#in the system instead of the number that ever arrived. With a sink the finished rows are handed over
+#in bulk (a dict of column arrays) every flush_size retirements and on flush(), before being reused.
+class PassengerTable:
+    def __init__(self, capacity=1024, sink=None, flush_size=4096):
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self._bind_columns()
+        self.size = 0  #rows handed out so far, the high-water mark of the table
+        self.live = 0
+        self.free = []
+        self.sink = sink
+        self.flush_size = flush_size
+        self.finished = []
+
+    def __len__(self):
+        return self.live
+
+    #Independent copy with the same rows, e.g. for a model snapshot (the sink is not copied)
+    def copy(self):
+        table = PassengerTable(capacity=1)
+        table.columns = {name: column.copy() for name, column in self.columns.items()}
+        table._bind_columns()
+        table.size = self.size
+        table.live = self.live
+        table.free = self.free + self.finished
+        return table
+
+    def _bind_columns(self):
+        for name, column in self.columns.items():
+            setattr(self, name, column)
+
+    def _grow(self, needed):
+        capacity = len(self.passenger_id)
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+        self._bind_columns()
+
+    def _rows(self, n):
+        reused = self.free[len(self.free) - n:] if n <= len(self.free) else self.free[:]
+        del self.free[len(self.free) - len(reused):]
+        fresh = n - len(reused)
+        if self.size + fresh > len(self.passenger_id):
+            self._grow(self.size + fresh)
+        rows = reused + list(range(self.size, self.size + fresh))
+        self.size += fresh
+        self.live += n
+        return rows
+
+    def add(self, passenger_id, origin, destination, arrival_time):
+        row = self._rows(1)[0]
+        self.passenger_id[row] = passenger_id
+        self.origin[row] = origin
+        self.destination[row] = destination
+        self.arrival_time[row] = arrival_time
+        self.boarding_time[row] = np.nan
+        self.alighting_time[row] = np.nan
+        return row
+
+    #Vectorized add, returns the new row ids in the same order as the inputs
+    def add_many(self, passenger_ids, origin, destinations, arrival_times):
+        rows = self._rows(len(arrival_times))
+        self.passenger_id[rows] = passenger_ids
+        self.origin[rows] = origin
+        self.destination[rows] = destinations
+        self.arrival_time[rows] = arrival_times
+        self.boarding_time[rows] = np.nan
+        self.alighting_time[rows] = np.nan
+        return rows
+
+    #Marks finished passengers; their rows are reused (after reaching the sink, if there is one)
+    def retire(self, rows):
+        self.live -= len(rows)
+        if self.sink is None:
+            self.free.extend(rows)
+            return
+        self.finished.extend(rows)
+        if len(self.finished) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if not self.finished:
+            return
+        rows = np.array(self.finished)
+        self.sink({name: column[rows] for name, column in self.columns.items()})
+        self.free.extend(self.finished)
+        self.finished = []
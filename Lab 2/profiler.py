@@ -0,0 +1,79 @@
+from time import perf_counter
+
+#Optional instrumentation of the bus models, off unless a Profiler is passed in (profiler=None costs one test per phase)
+#Counts process resumptions per process type, adds up the wall time of each phase of bus() and
+#passenger_generator() and keeps the high-water mark of every stop queue. Whatever env.run spends
+#outside the phases (event scheduling, the SimPy or heapq kernel) is reported as "kernel".
+#Lazy arrivals have no process, they are drawn inside the bus phase that first looks at the stop.
+class Profiler:
+    clock = staticmethod(perf_counter)
+
+    def __init__(self):
+        self.events = {}
+        self.seconds = {}
+        self.queue_high = {}
+        self.run_seconds = 0.0
+        self.replications = 0
+        self.per_replication = []  #summaries of the replications merged into this profiler
+
+    def event(self, process):
+        self.events[process] = self.events.get(process, 0) + 1
+
+    #Adds the time since started to phase and returns the current clock, to time the next phase from
+    def phase(self, name, started):
+        now = perf_counter()
+        self.seconds[name] = self.seconds.get(name, 0.0) + now - started
+        return now
+
+    def queue_length(self, stop, length):
+        if length > self.queue_high.get(stop, 0):
+            self.queue_high[stop] = length
+
+    def run(self, env, until):
+        started = perf_counter()
+        env.run(until=until)
+        self.run_seconds += perf_counter() - started
+        self.replications += 1
+
+    #Adds another profiler's totals (e.g. of one replication in a sweep) and keeps its summary
+    def merge(self, other):
+        for process, count in other.events.items():
+            self.events[process] = self.events.get(process, 0) + count
+        for name, seconds in other.seconds.items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        for stop, length in other.queue_high.items():
+            self.queue_length(stop, length)
+        self.run_seconds += other.run_seconds
+        self.replications += other.replications
+        self.per_replication.append(other.summary())
+        return self
+
+    def summary(self):
+        seconds = dict(self.seconds)
+        seconds["kernel"] = max(self.run_seconds - sum(self.seconds.values()), 0.0)
+        return {
+            "replications": self.replications,
+            "run_seconds": self.run_seconds,
+            "events": dict(self.events),
+            "seconds": seconds,
+            "queue_high_water": dict(self.queue_high),
+        }
+
+    #stop_names maps the stop ids the models record to names (e.g. NETWORK.stop_names)
+    def report(self, stop_names=None):
+        summary = self.summary()
+        lines = [f"{summary['replications']} replications, {summary['run_seconds']:.3f} s in env.run"]
+        for name, seconds in sorted(summary["seconds"].items(), key=lambda item: -item[1]):
+            share = seconds / summary["run_seconds"] if summary["run_seconds"] > 0 else 0.0
+            lines.append(f"  {name:<14} {seconds:>9.4f} s {share:>6.1%}")
+        for process, count in sorted(summary["events"].items()):
+            lines.append(f"  {process:<20} {count:>9} events")
+        longest = sorted(summary["queue_high_water"].items(), key=lambda item: -item[1])[:5]
+        lines.append("  longest queues: " + ", ".join(f"{stop if stop_names is None else stop_names[stop]} {length}" for stop, length in longest))
+        return "\n".join(lines)
+
+#Runs replicate(*args, profiler=Profiler()) and returns (result, profiler); picklable through functools.partial,
+#so a sweep can profile every replication on a process pool and merge the profilers afterwards
+def profiled(replicate, *args):
+    profiler = Profiler()
+    return replicate(*args, profiler=profiler), profiler
@@ -0,0 +1,118 @@
+import math
+import numpy as np
+
+#Streaming quantile sketch (KLL): a stack of compactors, level h holding items that each stand for 2^h values
+#When a level is over its capacity it is sorted and every other item (from a random first one) moves up a level,
+#so the sketch keeps O(k) items however long the stream is, with a rank error of roughly 1/k of the count.
+#Capacities shrink by 2/3 per level below the top. Has the add/add_many of RunningStats, so the bus models
+#can record into it unchanged (recorder=QuantileSketch), and two sketches merge into one of the combined stream.
+#Single adds are O(1): they fill a preallocated buffer of k values that joins level 0 only when it is full
+#(or when the sketch is read or merged).
+class QuantileSketch:
+    def __init__(self, k=1000, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.pending = np.empty(k)
+        self.num_pending = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        return max(2, math.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - level)))
+
+    def add(self, x):
+        x = float(x)
+        self.pending[self.num_pending] = x
+        self.num_pending += 1
+        self.count += 1
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        if self.num_pending == self.k:
+            self._flush()
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    #Moves the buffered single adds into level 0 (count, min and max already include them)
+    def _flush(self):
+        if self.num_pending:
+            self.levels[0] = np.concatenate([self.levels[0], self.pending[:self.num_pending]])
+            self.num_pending = 0
+            self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            buffer = self.levels[level]
+            if len(buffer) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                buffer = np.sort(buffer)
+                odd = len(buffer) % 2  #an odd item out stays behind
+                promoted = buffer[odd + self.rng.integers(2)::2]
+                self.levels[level] = buffer[:odd]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def merge(self, other):
+        self._flush()
+        other._flush()
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, buffer in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], buffer])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    #Items in order with the number of values each stands for
+    def _weighted(self):
+        self._flush()
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(buffer), 2.0 ** level) for level, buffer in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        return values[order], weights[order]
+
+    #Estimated quantiles at probabilities in [0, 1], interpolated between the items' midpoint ranks
+    #(0 and 1 give the exact minimum and maximum)
+    def quantiles(self, probabilities):
+        if self.count == 0:
+            return np.full(np.shape(probabilities), np.nan)
+        values, weights = self._weighted()
+        positions = np.cumsum(weights) - weights / 2
+        positions = np.concatenate([[0], positions, [weights.sum()]])
+        values = np.concatenate([[self.min], values, [self.max]])
+        return np.interp(np.asarray(probabilities) * weights.sum(), positions, values)
+
+    #Estimated fraction of the stream at or below x
+    def rank(self, x):
+        values, weights = self._weighted()
+        return weights[:np.searchsorted(values, x, side="right")].sum() / weights.sum()
+
+#Sketch of a stream given as an iterable of arrays (e.g. sampler_validation.sample_chunks)
+def sketch(chunks, k=1000, seed=None):
+    result = QuantileSketch(k, seed)
+    for chunk in chunks:
+        result.add_many(chunk)
+    return result
+
+#Q-Q curve of two sketched streams at num_quantiles evenly spaced probabilities (the midpoints of equal-mass cells)
+#and the correlation of its points, which stands in for the correlation of the fully sorted samples
+def qq_points(x_sketch, y_sketch, num_quantiles=200):
+    probabilities = (np.arange(num_quantiles) + 0.5) / num_quantiles
+    x_quantiles = x_sketch.quantiles(probabilities)
+    y_quantiles = y_sketch.quantiles(probabilities)
+    return x_quantiles, y_quantiles, float(np.corrcoef(x_quantiles, y_quantiles)[0, 1])
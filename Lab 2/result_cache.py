@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+from parallel_runner import run_replications
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".replication_cache")
+
+#JSON form of the values a replication config can hold (numpy arrays and scalars, seed sequences)
+def _canonical(value):
+    if isinstance(value, np.random.SeedSequence):
+        return {"entropy": value.entropy, "spawn_key": list(value.spawn_key)}
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot hash {type(value).__name__} in a replication config")
+
+#On-disk cache of replication results, content-addressed by the SHA-256 of the full configuration
+#Every entry is a pickle of {"config", "summary", "result"} at <key[:2]>/<key>.pkl, with optional raw
+#arrays (e.g. traces) next to it as <key>.npz. Reads refresh an entry's mtime and puts evict the
+#least recently used entries once the cache is larger than max_bytes.
+class ResultCache:
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=256 * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path in self._files())
+
+    #Key of a config: any JSON-able dict (plus numpy values and seed sequences), key order does not matter
+    def key(self, config):
+        text = json.dumps(config, sort_keys=True, default=_canonical)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key, extension=".pkl"):
+        return os.path.join(self.directory, key[:2], key + extension)
+
+    def _files(self):
+        for folder in os.scandir(self.directory):
+            if folder.is_dir():
+                for entry in os.scandir(folder.path):
+                    if entry.name.endswith((".pkl", ".npz")):
+                        yield entry.path
+
+    def _entries(self):
+        return [path for path in self._files() if path.endswith(".pkl")]
+
+    #Cached result for key, or None on a miss
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                entry = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return entry["result"]
+
+    #Raw arrays stored with key, or None
+    def get_raw(self, key):
+        path = self._path(key, ".npz")
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as raw:
+            return dict(raw)
+
+    #Stores a result with its config and summary (a dict of scalars, used by export), raw is a dict of arrays
+    def put(self, key, result, config=None, summary=None, raw=None):
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+        config = json.loads(json.dumps(config, default=_canonical)) if config is not None else None
+        self._write(self._path(key), lambda file: pickle.dump({"config": config, "summary": summary or {}, "result": result}, file))
+        if raw is not None:
+            self._write(self._path(key, ".npz"), lambda file: np.savez(file, **raw))
+        if self.size > self.max_bytes:
+            self.evict(self.max_bytes)
+
+    #Writes through a temporary file, so a crash never leaves a truncated entry behind
+    def _write(self, path, dump):
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            dump(file)
+        os.replace(temporary, path)
+        self.size += os.path.getsize(path) - old_size
+
+    #Removes least recently used entries until the cache takes at most max_bytes
+    def evict(self, max_bytes):
+        for path in sorted(self._entries(), key=os.path.getmtime):
+            if self.size <= max_bytes:
+                break
+            for file in (path, path[:-len(".pkl")] + ".npz"):
+                if os.path.exists(file):
+                    self.size -= os.path.getsize(file)
+                    os.remove(file)
+
+    #(key, config, summary) of every entry, e.g. to train a model on everything simulated so far
+    def entries(self):
+        for entry_path in self._entries():
+            with open(entry_path, "rb") as file:
+                entry = pickle.load(file)
+            yield os.path.basename(entry_path)[:-len(".pkl")], entry["config"] or {}, entry["summary"]
+
+    #Writes every entry as one row of a column table (.npz): the scalar config fields and the summary values
+    #Missing values are nan (or "" for text), load_columns() reads the file back as {column: array}
+    def export(self, path):
+        rows = []
+        for key, config, summary in self.entries():
+            row = {name: value for name, value in config.items() if isinstance(value, (bool, int, float, str))}
+            row.update(summary)
+            row["key"] = key
+            rows.append(row)
+
+        names = sorted({name for row in rows for name in row})
+        columns = {}
+        for name in names:
+            values = [row.get(name) for row in rows]
+            if any(isinstance(value, str) for value in values):
+                columns[name] = np.array(["" if value is None else str(value) for value in values])
+            else:
+                columns[name] = np.array([np.nan if value is None else value for value in values], dtype=float)
+        np.savez(path, **columns)
+        return columns
+
+#Column table written by ResultCache.export
+def load_columns(path):
+    with np.load(path) as columns:
+        return dict(columns)
+
+#run_replications through a cache: hits are loaded and only the misses are simulated, then stored
+#describe(*task) gives the full configuration of a task, summarize(result) the scalars kept for export
+def cached_replications(cache, replicate, tasks, describe, summarize=None, workers=1):
+    configs = [describe(*task) for task in tasks]
+    keys = [cache.key(config) for config in configs]
+    results = [cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    fresh = run_replications(replicate, [tasks[i] for i in missing], workers)
+    for i, result in zip(missing, fresh):
+        cache.put(keys[i], result, configs[i], summarize(result) if summarize is not None else None)
+        results[i] = result
+    return results
@@ -0,0 +1,43 @@
+#Terminal -> names of the routes starting there, built once from the routes table
+def outgoing_routes(routes):
+    routes_from = {}
+    for route_name, route_data in routes.items():
+        routes_from.setdefault(route_data["start"], []).append(route_name)
+    return routes_from
+
+#Number of passengers waiting along each route, kept up to date by the stop queues
+#Every enqueue/dequeue at a stop adds to the routes serving that stop, so reading a route's demand is O(1)
+class RouteDemand:
+    def __init__(self, routes):
+        self.waiting = {route_name: 0 for route_name in routes}
+        self.stop_routes = {}
+        for route_name, route_data in routes.items():
+            for stop in route_data["stops"]:
+                self.stop_routes.setdefault(stop, []).append(route_name)
+        self.lazy_queues = {route_name: [] for route_name in routes}
+
+    #Called by the stop queues with +n on enqueue and -n on dequeue
+    def add(self, stop, n):
+        for route_name in self.stop_routes[stop]:
+            self.waiting[route_name] += n
+
+    #Lazy queues only count arrivals once they are materialized, so they are caught up before reading
+    def watch_lazy(self, stop, lazy_queue):
+        for route_name in self.stop_routes[stop]:
+            self.lazy_queues[route_name].append(lazy_queue)
+
+    def total(self, route_name):
+        for lazy_queue in self.lazy_queues[route_name]:
+            lazy_queue.catch_up()
+        return self.waiting[route_name]
+
+    #Route with the most passengers waiting at all its stops, None if nobody waits on any of them
+    def busiest(self, candidates):
+        most_waiting = 0
+        next_route_name = None
+        for route_name in candidates:
+            total_waiting = self.total(route_name)
+            if total_waiting > most_waiting:
+                most_waiting = total_waiting
+                next_route_name = route_name
+        return next_route_name
@@ -0,0 +1,108 @@
+import math
+import numpy as np
+from statistics import NormalDist
+
+#Two-sided Student t quantile: exact for df 1 and 2, Cornish-Fisher expansion around the normal quantile otherwise
+def t_quantile(df, confidence=0.95):
+    p = 0.5 + confidence / 2
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = NormalDist().inv_cdf(p)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+#Online mean/variance (Welford) with min and max, O(1) memory however many values are added
+class RunningStats:
+    def __init__(self):
+        self.count = 0
+        self.mean = math.nan
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        if self.count == 1:
+            self.mean = x
+        else:
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    #Adds a whole array of values at once by merging its own mean/variance into the accumulator
+    def add_many(self, values):
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        batch = RunningStats()
+        batch.count = len(values)
+        batch.mean = float(values.mean())
+        batch.m2 = float(((values - batch.mean) ** 2).sum())
+        batch.min = float(values.min())
+        batch.max = float(values.max())
+        self.merge(batch)
+
+    #Combines two accumulators as if every value had been added to one (Chan et al.)
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    #ddof=0 matches np.var/np.std, ddof=1 is the sample variance
+    def variance(self, ddof=0):
+        if self.count - ddof <= 0:
+            return math.nan
+        return self.m2 / (self.count - ddof)
+
+    def std(self, ddof=0):
+        return math.sqrt(self.variance(ddof))
+
+    #Half-width of the t confidence interval for the mean, nan with fewer than two values
+    def half_width(self, confidence=0.95):
+        if self.count < 2:
+            return math.nan
+        return t_quantile(self.count - 1, confidence) * math.sqrt(self.variance(1) / self.count)
+
+#Time average of a piecewise-constant level (e.g. passengers on board), integrated between events
+class TimeWeightedStats:
+    def __init__(self, start_time=0.0, level=0.0):
+        self.start_time = start_time
+        self.last_time = start_time
+        self.level = level
+        self.area = 0.0
+        self.min = level
+        self.max = level
+
+    def change(self, now, delta):
+        self.area += self.level * (now - self.last_time)
+        self.last_time = now
+        self.level += delta
+        if self.level < self.min:
+            self.min = self.level
+        if self.level > self.max:
+            self.max = self.level
+
+    #Average level over [start_time, until]
+    def mean(self, until):
+        if until <= self.start_time:
+            return self.level
+        return (self.area + self.level * (until - self.last_time)) / (until - self.start_time)
@@ -0,0 +1,140 @@
+import math
+import numpy as np
+from statistics import NormalDist
+from parallel_runner import run_replications
+
+#Exponential samplers to validate, sampler(rng, lambda_value, size) -> array of size samples
+#The inverse transform of Task 2A1, vectorized: 1 - U is in (0, 1], so the log is always finite
+def inverse_transform(rng, lambda_value, size):
+    return -(1 / lambda_value) * np.log(1.0 - rng.random(size))
+
+#NumPy's own exponential sampler, the reference (random.expovariate in Task 2A1)
+def numpy_exponential(rng, lambda_value, size):
+    return rng.exponential(1 / lambda_value, size)
+
+#Kolmogorov distribution tail P(K > x) with Stephens' small-sample correction of x, for the KS p-value
+def ks_p_value(statistic, n):
+    x = (math.sqrt(n) + 0.12 + 0.11 / math.sqrt(n)) * statistic
+    if x < 0.2:
+        return 1.0
+    return min(1.0, max(0.0, 2 * sum((-1) ** (k - 1) * math.exp(-2 * k * k * x * x) for k in range(1, 101))))
+
+#Upper tail of the chi-square distribution with df degrees of freedom (Wilson-Hilferty normal approximation)
+def chi_square_p_value(statistic, df):
+    z = ((statistic / df) ** (1 / 3) - (1 - 2 / (9 * df))) / math.sqrt(2 / (9 * df))
+    return 1 - NormalDist().cdf(z)
+
+#Streaming goodness-of-fit statistics of samples against the exponential distribution with rate lambda_value
+#Memory is fixed by bins, not by the number of samples: every sample is mapped to u = F(x), which is uniform
+#under the hypothesis, and only a histogram of u over bins equal-width cells is kept, together with the sums
+#of the powers 1..4 of d = lambda_value * x - 1 (the standardized sample centred on its expected mean).
+#The histogram gives the KS statistic to within one cell (exact at the cell edges) and the binned chi-square,
+#the power sums the mean, variance, skewness and kurtosis. Two checks of the same lambda merge exactly.
+class ExponentialCheck:
+    def __init__(self, lambda_value, bins=2 ** 18):
+        self.lambda_value = lambda_value
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.count = 0
+        self.power_sums = np.zeros(4)
+
+    def add(self, samples):
+        samples = np.asarray(samples, dtype=float)
+        bins = len(self.counts)
+        u = -np.expm1(-self.lambda_value * samples)
+        self.counts += np.bincount(np.minimum((u * bins).astype(np.int64), bins - 1), minlength=bins)
+        d = self.lambda_value * samples - 1
+        d2 = d * d
+        self.power_sums += [d.sum(), d2.sum(), (d2 * d).sum(), (d2 * d2).sum()]
+        self.count += len(samples)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.count += other.count
+        self.power_sums += other.power_sums
+        return self
+
+    #Lower and upper bound of the KS statistic sup |F_n(x) - F(x)|, from the cell edges and the cell contents
+    def ks_bounds(self):
+        bins = len(self.counts)
+        ecdf = np.concatenate([[0], np.cumsum(self.counts)]) / self.count
+        edges = np.arange(bins + 1) / bins
+        lower = np.abs(ecdf - edges).max()
+        upper = max((ecdf[1:] - edges[:-1]).max(), (edges[1:] - ecdf[:-1]).max())
+        return float(lower), float(upper)
+
+    #Pearson chi-square over chi_square_bins equiprobable cells (must divide bins), with its p-value
+    def chi_square(self, chi_square_bins=1024):
+        if len(self.counts) % chi_square_bins:
+            raise ValueError(f"chi_square_bins must divide the {len(self.counts)} histogram bins")
+        observed = self.counts.reshape(chi_square_bins, -1).sum(axis=1)
+        expected = self.count / chi_square_bins
+        statistic = float(((observed - expected) ** 2).sum() / expected)
+        return statistic, chi_square_p_value(statistic, chi_square_bins - 1)
+
+    #Moments of the sample against the exponential's (mean 1/lambda, variance 1/lambda^2, skewness 2, excess kurtosis 6)
+    #The z-scores of the mean and variance use their asymptotic standard errors under the hypothesis
+    #(standardized, the exponential has variance 1 and fourth central moment 9, so Var(s^2) = 8/n)
+    def moments(self):
+        n = self.count
+        m1, m2, m3, m4 = (self.power_sums / n).tolist()
+        variance = m2 - m1 * m1
+        third = m3 - 3 * m1 * m2 + 2 * m1 ** 3
+        fourth = m4 - 4 * m1 * m3 + 6 * m1 * m1 * m2 - 3 * m1 ** 4
+        return {
+            "mean": (m1 + 1) / self.lambda_value,
+            "variance": variance / self.lambda_value ** 2,
+            "skewness": third / variance ** 1.5,
+            "excess_kurtosis": fourth / variance ** 2 - 3,
+            "mean_z": m1 * math.sqrt(n),
+            "variance_z": (variance - 1) * math.sqrt(n / 8),
+        }
+
+    def result(self, chi_square_bins=1024):
+        ks_lower, ks_upper = self.ks_bounds()
+        chi_square, chi_square_p = self.chi_square(chi_square_bins)
+        return dict(
+            self.moments(),
+            samples=self.count,
+            ks_statistic=(ks_lower, ks_upper),
+            ks_p_value=(ks_p_value(ks_upper, self.count), ks_p_value(ks_lower, self.count)),
+            chi_square=chi_square,
+            chi_square_p_value=chi_square_p,
+        )
+
+#The stream of sampler as chunks of at most chunk_size samples, for consumers that take one chunk at a time
+def sample_chunks(sampler, lambda_value, num_samples, seed=None, chunk_size=2 ** 20):
+    rng = np.random.default_rng(seed)
+    for start in range(0, num_samples, chunk_size):
+        yield sampler(rng, lambda_value, min(chunk_size, num_samples - start))
+
+#One block of the stream, drawn chunk by chunk from its own seed so blocks can run on a process pool
+def check_block(sampler, lambda_value, num_samples, seed, chunk_size, bins):
+    rng = np.random.default_rng(seed)
+    check = ExponentialCheck(lambda_value, bins)
+    for start in range(0, num_samples, chunk_size):
+        check.add(sampler(rng, lambda_value, min(chunk_size, num_samples - start)))
+    return check
+
+#Validates sampler against Exp(lambda_value) on num_samples samples, generated in chunks of chunk_size
+#The stream is cut into blocks of block_chunks chunks with independent seeds spawned from seed, so the result
+#depends on the seed and the block layout but not on workers. Peak memory is a few chunk_size arrays and one
+#histogram per worker, whatever num_samples is.
+def validate_sampler(sampler, lambda_value, num_samples, seed=None, chunk_size=2 ** 20, bins=2 ** 18, block_chunks=64, workers=1, chi_square_bins=1024):
+    block_size = chunk_size * block_chunks
+    sizes = [min(block_size, num_samples - start) for start in range(0, num_samples, block_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(sampler, lambda_value, size, block_seed, chunk_size, bins) for size, block_seed in zip(sizes, seeds)]
+    check = ExponentialCheck(lambda_value, bins)
+    group = 1 if workers == 1 else 16  #blocks in flight at once, each holds a histogram until it is merged
+    for start in range(0, len(tasks), group):
+        for block in run_replications(check_block, tasks[start:start + group], workers):
+            check.merge(block)
+    return check.result(chi_square_bins)
+
+def format_result(name, result):
+    lines = [f"{name}: {result['samples']} samples"]
+    lines.append(f"  mean {result['mean']:.6f} (z {result['mean_z']:+.2f}), variance {result['variance']:.6f} (z {result['variance_z']:+.2f})")
+    lines.append(f"  skewness {result['skewness']:.4f} (2), excess kurtosis {result['excess_kurtosis']:.4f} (6)")
+    lines.append(f"  KS D in [{result['ks_statistic'][0]:.3g}, {result['ks_statistic'][1]:.3g}], p in [{result['ks_p_value'][0]:.3f}, {result['ks_p_value'][1]:.3f}]")
+    lines.append(f"  chi-square {result['chi_square']:.1f}, p {result['chi_square_p_value']:.3f}")
+    return "\n".join(lines)
@@ -0,0 +1,58 @@
+import math
+import numpy as np
+from parallel_runner import run_replications
+from running_stats import RunningStats, t_quantile
+
+#Relative half-width of the confidence interval of a metric, inf until it can be estimated
+def relative_half_width(stats, confidence=0.95):
+    half_width = stats.half_width(confidence)
+    if math.isnan(half_width) or stats.mean == 0:
+        return math.inf if half_width != 0 else 0.0
+    return half_width / abs(stats.mean)
+
+#Replications still needed to reach rel_precision, from the current estimate of the variance
+def runs_needed(stats, rel_precision, confidence=0.95):
+    if stats.count < 2 or stats.mean == 0:
+        return stats.count + 1
+    spread = t_quantile(stats.count - 1, confidence) * stats.std(1) / (rel_precision * abs(stats.mean))
+    return math.ceil(spread * spread)
+
+#Sequential replications: every config starts with min_runs replications, then rounds of extra replications
+#are added to the configs whose confidence intervals are still wider than rel_precision times the mean
+#for some metric, until they converge or reach max_runs. measure(config, result) maps one replication's
+#result to {metric: value}. Replication j of config i always gets seed child (i, j), the same as
+#replication_seeds, so a sequential run reproduces the first replications of a fixed-size one.
+#Returns one dict per config with its results, per-metric RunningStats, replications and whether it converged.
+def run_sequential(replicate, configs, measure, seed=None, rel_precision=0.05, min_runs=5, max_runs=200, max_batch=20, workers=1, confidence=0.95):
+    config_seeds = np.random.SeedSequence(seed).spawn(len(configs))
+    outcomes = [{"config": config, "results": [], "stats": {}, "runs": 0, "converged": False} for config in configs]
+    pending = {i: min(min_runs, max_runs) for i in range(len(configs))}
+
+    while pending:
+        tasks = []
+        owners = []
+        for i, extra in pending.items():
+            for run_seed in config_seeds[i].spawn(extra):
+                tasks.append((*configs[i], run_seed))
+                owners.append(i)
+        results = run_replications(replicate, tasks, workers)
+
+        for i, result in zip(owners, results):
+            outcome = outcomes[i]
+            outcome["results"].append(result)
+            outcome["runs"] += 1
+            for name, value in measure(configs[i], result).items():
+                outcome["stats"].setdefault(name, RunningStats()).add(value)
+
+        next_pending = {}
+        for i in pending:
+            outcome = outcomes[i]
+            stats = outcome["stats"].values()
+            if all(relative_half_width(s, confidence) <= rel_precision for s in stats):
+                outcome["converged"] = True
+            elif outcome["runs"] < max_runs:
+                needed = max(runs_needed(s, rel_precision, confidence) for s in stats)
+                next_pending[i] = min(max(needed - outcome["runs"], 1), max_batch, max_runs - outcome["runs"])
+        pending = next_pending
+
+    return outcomes
@@ -0,0 +1,97 @@
+from collections import deque
+import numpy as np
+
+#FIFO bus stop queue: O(1) append and len, take(k) removes the k oldest entries in O(k)
+#With a RouteDemand attached, every enqueue/dequeue also updates the waiting totals of the routes serving stop
+class StopQueue:
+    def __init__(self, stop=None, demand=None):
+        self.items = deque()
+        self.stop = stop
+        self.demand = demand
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def append(self, entry):
+        self.items.append(entry)
+        if self.demand is not None:
+            self.demand.add(self.stop, 1)
+
+    def extend(self, entries):
+        size = len(self.items)
+        self.items.extend(entries)
+        if self.demand is not None:
+            self.demand.add(self.stop, len(self.items) - size)
+
+    def take(self, k):
+        popleft = self.items.popleft
+        taken = [popleft() for _ in range(k)]
+        if self.demand is not None:
+            self.demand.add(self.stop, -k)
+        return taken
+
+#Array-backed ring buffer of float timestamps, used when the queue only holds arrival times
+#Grows by doubling, so appends are amortized O(1) and take(k) is a slice copy
+class RingBuffer:
+    def __init__(self, stop=None, demand=None, capacity=64):
+        self.buffer = np.empty(capacity)
+        self.head = 0
+        self.size = 0
+        self.stop = stop
+        self.demand = demand
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self._slice(0, self.size).tolist())
+
+    def _grow(self, needed):
+        capacity = len(self.buffer)
+        while capacity < needed:
+            capacity *= 2
+        self.buffer = np.concatenate([self._slice(0, self.size), np.empty(capacity - self.size)])
+        self.head = 0
+
+    #Copy of the entries at positions start..stop counted from the oldest one
+    def _slice(self, start, stop):
+        capacity = len(self.buffer)
+        first = (self.head + start) % capacity
+        last = first + (stop - start)
+        if last <= capacity:
+            return self.buffer[first:last].copy()
+        return np.concatenate([self.buffer[first:], self.buffer[:last - capacity]])
+
+    def append(self, timestamp):
+        if self.size == len(self.buffer):
+            self._grow(self.size + 1)
+        self.buffer[(self.head + self.size) % len(self.buffer)] = timestamp
+        self.size += 1
+        if self.demand is not None:
+            self.demand.add(self.stop, 1)
+
+    def extend(self, timestamps):
+        if not isinstance(timestamps, np.ndarray):
+            timestamps = np.fromiter(timestamps, dtype=float)
+        n = len(timestamps)
+        if self.size + n > len(self.buffer):
+            self._grow(self.size + n)
+        capacity = len(self.buffer)
+        first = (self.head + self.size) % capacity
+        split = min(n, capacity - first)
+        self.buffer[first:first + split] = timestamps[:split]
+        self.buffer[:n - split] = timestamps[split:]
+        self.size += n
+        if self.demand is not None:
+            self.demand.add(self.stop, n)
+
+    def take(self, k):
+        taken = self._slice(0, k)
+        self.head = (self.head + k) % len(self.buffer)
+        self.size -= k
+        if self.demand is not None:
+            self.demand.add(self.stop, -k)
+        return taken
@@ -0,0 +1,139 @@
+import math
+import numpy as np
+from adaptive_sweep import Space
+from running_stats import RunningStats
+
+LENGTH_GRID = np.geomspace(0.05, 5, 12)  #length scales tried per input (inputs are scaled to the unit cube)
+SIGNAL_GRID = [0.25, 1.0, 4.0]  #signal variances tried (outputs are standardized)
+
+#Gaussian process regression of means observed at points (unit cube) with known noise variances, squared exponential
+#kernel with one length scale per input. The hyperparameters maximize the log marginal likelihood over
+#LENGTH_GRID x SIGNAL_GRID, one input at a time. K^-1 is kept, so a prediction is O(n^2) with no solve.
+#The standard deviation is widened by the RMS of the leave-one-out z-scores when that is above 1, so a kernel that
+#fits the training points better than it predicts between them does not claim more certainty than it has.
+class GaussianProcess:
+    def __init__(self, points, means, noise):
+        self.points = np.asarray(points, dtype=float)
+        means = np.asarray(means, dtype=float)
+        self.shift = means.mean()
+        self.scale = means.std() if means.std() > 0 else 1.0
+        y = (means - self.shift) / self.scale
+        noise = np.asarray(noise, dtype=float) / self.scale ** 2 + 1e-8
+        squared = [(self.points[:, None, d] - self.points[None, :, d]) ** 2 for d in range(self.points.shape[1])]
+
+        def log_likelihood(length, signal):
+            covariance = signal * np.exp(-0.5 * sum(s / (l * l) for s, l in zip(squared, length))) + np.diag(noise)
+            try:
+                cholesky = np.linalg.cholesky(covariance)
+            except np.linalg.LinAlgError:
+                return -math.inf, None
+            alpha = np.linalg.solve(cholesky.T, np.linalg.solve(cholesky, y))
+            return -0.5 * y @ alpha - np.log(np.diag(cholesky)).sum(), cholesky
+
+        self.length = np.full(self.points.shape[1], 0.3)
+        self.signal = 1.0
+        best = log_likelihood(self.length, self.signal)[0]
+        for _ in range(2):
+            for d in range(len(self.length)):
+                for length in LENGTH_GRID:
+                    trial = self.length.copy()
+                    trial[d] = length
+                    value = log_likelihood(trial, self.signal)[0]
+                    if value > best:
+                        best, self.length = value, trial
+            for signal in SIGNAL_GRID:
+                value = log_likelihood(self.length, signal)[0]
+                if value > best:
+                    best, self.signal = value, signal
+
+        cholesky = log_likelihood(self.length, self.signal)[1]
+        inverse_cholesky = np.linalg.inv(cholesky)
+        self.inverse = inverse_cholesky.T @ inverse_cholesky
+        self.alpha = self.inverse @ y
+        loo_z = self.alpha / np.sqrt(np.diag(self.inverse))  #residual over the std of each point predicted from the others
+        self.calibration = max(1.0, float(np.sqrt((loo_z ** 2).mean())))
+
+    #Mean and standard deviation of the underlying (noise-free) mean at point
+    def predict(self, point):
+        k = self.signal * np.exp(-0.5 * (((self.points - point) / self.length) ** 2).sum(axis=1))
+        variance = max(self.signal - k @ self.inverse @ k, 0.0)
+        return float(self.shift + self.scale * (k @ self.alpha)), float(self.calibration * self.scale * math.sqrt(variance))
+
+#Surrogate of simulation outputs: one Gaussian process per metric and group (a categorical input such as the
+#route strategy, None when there is none) over the numeric inputs in bounds {name: (low, high)}.
+#query() answers from the surrogate when every metric's standard deviation is within rel_threshold of its
+#mean, otherwise it calls simulate(group, config) -> {metric: RunningStats of the replication values},
+#adds the runs to the training set (the group is refitted on its next query) and returns the simulated means.
+#A group needs min_points configs (default: inputs + 2) before it is fitted, until then every query simulates.
+class Surrogate:
+    def __init__(self, simulate, bounds, rel_threshold=0.05, min_points=None):
+        self.simulate = simulate
+        self.space = Space(bounds)
+        self.rel_threshold = rel_threshold
+        self.min_points = min_points or len(self.space.names) + 2
+        self.points = {}  #group -> {config: {metric: RunningStats}}
+        self.models = {}  #group -> {metric: GaussianProcess}, or None while the group has too few configs
+        self.simulations = 0
+
+    def add(self, group, config, stats):
+        point = self.points.setdefault(group, {}).setdefault(tuple(config), {})
+        for metric, metric_stats in stats.items():
+            point.setdefault(metric, RunningStats()).merge(metric_stats)
+        self.models.pop(group, None)
+
+    #Adds a training set {(group, config): {metric: RunningStats}}, e.g. from training_points
+    def train(self, points):
+        for (group, config), stats in points.items():
+            self.add(group, config, stats)
+        return self
+
+    def _fit(self, group):
+        points = self.points.get(group, {})
+        if len(points) < self.min_points:
+            self.models[group] = None
+            return
+        unit_points = np.array([self.space.unit(config) for config in points])
+        metrics = sorted(set.intersection(*(set(stats) for stats in points.values())))
+        models = {}
+        for metric in metrics:
+            stats = [point[metric] for point in points.values()]
+            noise = np.array([s.variance(1) / s.count if s.count > 1 else np.nan for s in stats])
+            noise[np.isnan(noise)] = np.nanmax(noise, initial=0) if np.isfinite(noise).any() else 0  #one replication: assume the noisiest
+            models[metric] = GaussianProcess(unit_points, [s.mean for s in stats], noise)
+        self.models[group] = models
+
+    #{metric: (mean, std)} from the surrogate, None while the group cannot be fitted
+    def predict(self, config, group=None):
+        if group not in self.models:
+            self._fit(group)
+        models = self.models[group]
+        if models is None:
+            return None
+        point = self.space.unit(config)
+        return {metric: model.predict(point) for metric, model in models.items()}
+
+    #({metric: (mean, std)}, simulated): the surrogate's answer, or the simulated one when it is not sure enough
+    def query(self, config, group=None):
+        prediction = self.predict(config, group)
+        if prediction is not None and all(std <= self.rel_threshold * abs(mean) for mean, std in prediction.values()):
+            return prediction, False
+        self.add(group, config, self.simulate(group, tuple(config)))
+        self.simulations += 1
+        stats = self.points[group][tuple(config)]
+        return {metric: (s.mean, s.std(1) / math.sqrt(s.count) if s.count > 1 else math.nan) for metric, s in stats.items()}, True
+
+#Training set from a result cache: the entries of the model reference is a replication config of (same config
+#apart from inputs, group_key and seed), grouped by group and inputs, with the per-replication values of metrics
+def training_points(cache, reference, inputs, metrics, group_key=None):
+    varying = set(inputs) | {group_key, "seed"}
+    fixed = cache.key({name: value for name, value in reference.items() if name not in varying})
+    points = {}
+    for _, config, summary in cache.entries():
+        if cache.key({name: value for name, value in config.items() if name not in varying}) != fixed:
+            continue
+        stats = points.setdefault((config.get(group_key), tuple(config[name] for name in inputs)), {})
+        for metric in metrics:
+            value = summary.get(metric)
+            if value is not None and math.isfinite(value):
+                stats.setdefault(metric, RunningStats()).add(value)
+    return points
@@ -0,0 +1,17 @@
+import importlib.util
+import os
+import sys
+
+LAB_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#Imports one of the "Task ..." scripts as a module (the file names have spaces, so a plain import does not work)
+#The scripts only plot under __main__, so importing them just defines the model
+def load_task(name):
+    module_name = name.replace(" ", "_")
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(LAB_DIR, name + ".py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,199 @@
+import collections
+import random
+import numpy as np
+import pytest
+from alighting import alight_random
+from batch_means import BatchSeries, steady_state
+from destination_sampler import DestinationSampler
+from event_trace import Tracer
+from lockstep_engine import LockstepCountingModel
+from quantile_sketch import QuantileSketch
+from running_stats import RunningStats
+from stop_queue import RingBuffer
+from surrogate import Surrogate
+from task_loader import load_task
+
+#The invariants the models rely on: a seed fixes a run whatever the engine or the number of workers,
+#the vectorized replacements agree with what they replace, and the streaming estimators are accurate
+
+#Seed reproducibility and engine equivalence of the process models
+
+@pytest.mark.parametrize("engine", ["simpy", "heapq"])
+def test_counting_model_is_fixed_by_random_seed(engine):
+    task = load_task("Task 2A3 and 2A4")
+    random.seed(7)
+    first = task.run_simulation([5, 10], 3, engine=engine)
+    random.seed(7)
+    assert task.run_simulation([5, 10], 3, engine=engine) == first
+
+def test_counting_model_engines_agree():
+    task = load_task("Task 2A3 and 2A4")
+    random.seed(7)
+    simpy_result = task.run_simulation([5, 10], 3, engine="simpy")
+    random.seed(7)
+    assert task.run_simulation([5, 10], 3, engine="heapq") == simpy_result
+
+@pytest.mark.parametrize("name, args", [
+    ("Task 2A5", ([5, 10], 3)),
+    ("Task 2B1", ([5, 10], 3, 1.0)),
+    ("Task 2B2", ([5, 10], 3, "demand")),
+])
+@pytest.mark.parametrize("arrivals", ["process", "lazy"])
+def test_models_are_fixed_by_seed_whatever_the_engine(name, args, arrivals):
+    task = load_task(name)
+    simpy_result = task.run_simulation(*args, seed=11, arrivals=arrivals, engine="simpy")
+    assert task.run_simulation(*args, seed=11, arrivals=arrivals, engine="simpy") == simpy_result
+    assert task.run_simulation(*args, seed=11, arrivals=arrivals, engine="heapq") == simpy_result
+    assert task.run_simulation(*args, seed=12, arrivals=arrivals, engine="simpy") != simpy_result
+
+def test_parallel_replications_match_serial_ones():
+    task = load_task("Task 2B1")
+    serial = task.run_simulation([5, 7], 4, 1.0, seed=3, workers=1)
+    assert task.run_simulation([5, 7], 4, 1.0, seed=3, workers=2) == serial
+
+def test_tracing_does_not_change_the_run():
+    task = load_task("Task 2A5")
+    tracer = Tracer()
+    assert task.run_simulation([5], 2, seed=5, tracer=tracer) == task.run_simulation([5], 2, seed=5)
+    assert tracer.count > 0
+
+#The lockstep engine agrees with the process model in distribution (not draw for draw)
+
+def test_lockstep_engine_matches_process_model():
+    task = load_task("Task 2A3 and 2A4")
+    n_b, num_runs = 10, 200
+    model = LockstepCountingModel(task.NETWORK, task.CAPACITY, task.PROB_LEAVE)
+    lockstep = model.run(n_b, num_runs, task.SIMULATION_TIME, np.random.default_rng(1))[0]
+
+    random.seed(1)
+    process = RunningStats()
+    for _ in range(num_runs):
+        process.add(task.run_simulation([n_b], 1, engine="heapq")[0][0])
+    standard_error = np.sqrt(lockstep.var(ddof=1) / num_runs + process.variance(1) / num_runs)
+    assert abs(lockstep.mean() - process.mean) < 4 * standard_error
+
+#Samplers
+
+def test_weighted_destinations_follow_the_od_matrix():
+    num_stops = 6
+    weights = np.random.default_rng(2).random((num_stops, num_stops)) + 0.1
+    sampler = DestinationSampler(num_stops, np.random.default_rng(3), weights)
+    expected = weights.copy()
+    np.fill_diagonal(expected, 0)
+    expected /= expected.sum(axis=1, keepdims=True)
+    for origin in range(num_stops):
+        counts = np.bincount(sampler.draw_many(origin, 200000), minlength=num_stops)
+        assert counts[origin] == 0
+        assert np.abs(counts / 200000 - expected[origin]).max() < 0.005
+
+def test_uniform_destinations_skip_the_origin():
+    sampler = DestinationSampler(5, np.random.default_rng(4))
+    for origin in range(5):
+        counts = np.bincount([sampler.draw(origin) for _ in range(20000)], minlength=5)
+        assert counts[origin] == 0
+        assert np.abs(np.delete(counts, origin) / 20000 - 0.25).max() < 0.015
+
+def test_alighting_leaves_every_subset_equally_likely():
+    rng = np.random.default_rng(5)
+    subsets = collections.Counter()
+    for _ in range(60000):
+        on_board = list(range(4))
+        leaving = alight_random(on_board, 0.5, rng)
+        assert sorted(leaving + on_board) == [0, 1, 2, 3]
+        subsets[frozenset(leaving)] += 1
+    #p = 0.5 makes all 16 subsets equally likely
+    assert len(subsets) == 16
+    assert max(abs(count / 60000 - 1 / 16) for count in subsets.values()) < 0.005
+
+#Streaming estimators and buffers
+
+def test_quantile_sketch_is_accurate_and_mergeable():
+    values = np.random.default_rng(6).random(200000)
+    probabilities = np.linspace(0.01, 0.99, 50)
+    whole = QuantileSketch(200, seed=1)
+    for value in values[:1000].tolist():
+        whole.add(value)
+    whole.add_many(values[1000:])
+    assert whole.count == len(values) and whole.min == values.min() and whole.max == values.max()
+    assert np.abs(whole.quantiles(probabilities) - probabilities).max() < 0.02
+
+    halves = QuantileSketch(200, seed=1).merge(QuantileSketch(200, seed=2))
+    halves.add_many(values[:100000])
+    other = QuantileSketch(200, seed=3)
+    other.add_many(values[100000:])
+    halves.merge(other)
+    assert halves.count == len(values)
+    assert np.abs(halves.quantiles(probabilities) - probabilities).max() < 0.02
+
+def test_quantile_sketch_is_fixed_by_seed():
+    values = np.random.default_rng(7).exponential(size=50000)
+    first, second = QuantileSketch(100, seed=9), QuantileSketch(100, seed=9)
+    first.add_many(values)
+    second.add_many(values)
+    assert np.array_equal(first.quantiles([0.1, 0.5, 0.9]), second.quantiles([0.1, 0.5, 0.9]))
+
+def test_running_stats_merge_matches_one_pass():
+    values = np.random.default_rng(8).normal(3, 2, 1001)
+    whole, left, right = RunningStats(), RunningStats(), RunningStats()
+    whole.add_many(values)
+    left.add_many(values[:400])
+    for value in values[400:].tolist():
+        right.add(value)
+    left.merge(right)
+    assert left.count == whole.count
+    assert left.mean == pytest.approx(values.mean()) and whole.mean == pytest.approx(values.mean())
+    assert left.variance(1) == pytest.approx(values.var(ddof=1))
+
+def test_batch_means_cut_the_warmup_and_cover_the_mean():
+    rng = np.random.default_rng(9)
+    warmup = 10 * np.exp(-np.arange(2000) / 200)
+    series = BatchSeries()
+    series.add_many(3 + warmup[:1000] + rng.normal(size=1000))
+    for value in (3 + warmup[1000:] + rng.normal(size=1000)).tolist():
+        series.add(value)
+    series.add_many(3 + rng.normal(size=48000))
+    estimate = steady_state(series)
+    assert estimate["warmup"] >= 500
+    assert abs(estimate["mean"] - 3) < estimate["half_width"]
+    assert estimate["warmup"] + estimate["observations"] == 50000
+
+def test_ring_buffer_is_fifo_across_wraps_and_growth():
+    queue = RingBuffer(capacity=4)
+    expected = collections.deque()
+    next_value = 0.0
+    rng = np.random.default_rng(10)
+    for _ in range(500):
+        if rng.random() < 0.5:
+            values = np.arange(next_value, next_value + rng.integers(1, 6))
+            if len(values) > 1:
+                queue.extend(values)
+            else:
+                queue.append(values[0])
+            expected.extend(values.tolist())
+            next_value += len(values)
+        else:
+            k = int(rng.integers(0, len(expected) + 1))
+            assert queue.take(k).tolist() == [expected.popleft() for _ in range(k)]
+        assert len(queue) == len(expected) and list(queue) == list(expected)
+
+#Surrogate
+
+def test_surrogate_answers_near_its_data_and_simulates_away_from_it():
+    rng = np.random.default_rng(11)
+
+    def simulate(group, config):
+        stats = RunningStats()
+        stats.add_many(10 + np.sin(3 * config[0]) + rng.normal(0, 0.02, 20))
+        return {"y": stats}
+
+    surrogate = Surrogate(simulate, {"x": (0.0, 2.0)}, rel_threshold=0.01)
+    for x in np.linspace(0, 1, 9):
+        surrogate.add(None, (float(x),), simulate(None, (float(x),)))
+
+    estimates, simulated = surrogate.query((0.55,))
+    assert not simulated
+    mean, std = estimates["y"]
+    assert abs(mean - (10 + np.sin(1.65))) < max(3 * std, 0.02)
+
+    _, simulated = surrogate.query((1.9,))
+    assert simulated and surrogate.simulations == 1
@@ -0,0 +1,64 @@
+import numpy as np
+
+#Purposes of the substreams of one replication, used as spawn keys
+ARRIVALS, DESTINATIONS, ALIGHTING, INITIAL_ROUTES, ROUTE_CHOICE = range(5)
+
+#numpy-Generator-like wrapper that draws everything by inverse transform from one uniform stream,
+#so a replication can be replayed with 1 - U (antithetic=True) to get a negatively correlated twin.
+#Covers the calls the bus models make: random, exponential, integers, binomial and choice without replacement.
+class UniformGenerator:
+    def __init__(self, rng, antithetic=False):
+        self.rng = rng
+        self.antithetic = antithetic
+
+    def _uniform(self, size=None):
+        u = self.rng.random(size) + 2.0 ** -54  #open interval (0, 1), so 1 - u is never 0 either
+        return 1.0 - u if self.antithetic else u
+
+    def random(self, size=None):
+        return self._uniform(size)
+
+    def exponential(self, scale=1.0, size=None):
+        return -scale * np.log(self._uniform(size))
+
+    def integers(self, high, size=None):
+        if size is None:
+            return int(self._uniform() * high)
+        return (self._uniform(size) * high).astype(np.int64)
+
+    #Inverse CDF walk, fine for the small n of passengers on one bus
+    def binomial(self, n, p):
+        if p <= 0:
+            return 0
+        if p >= 1:
+            return n
+        u = self._uniform()
+        odds = p / (1 - p)
+        pmf = (1 - p) ** n
+        cdf = pmf
+        k = 0
+        while u > cdf and k < n:
+            pmf *= odds * (n - k) / (k + 1)
+            k += 1
+            cdf += pmf
+        return k
+
+    def choice(self, n, size, replace=False):
+        if replace:
+            return self.integers(n, size)
+        return np.argsort(self._uniform(n), kind="stable")[:size]
+
+#Dedicated random streams of one replication, one per purpose (and per stop or bus where it matters)
+#Substreams are derived from the replication seed without spawning from it, so the same seed gives
+#the same streams however often it is used: two strategies run with one seed see identical arrivals,
+#destinations, alighting draws and initial routes (common random numbers).
+#antithetic=None gives plain numpy Generators; False/True give the two members of an antithetic pair.
+class ReplicationStreams:
+    def __init__(self, seed, antithetic=None):
+        self.seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.antithetic = antithetic
+
+    def stream(self, purpose, index=0):
+        child = np.random.SeedSequence(self.seed_seq.entropy, spawn_key=self.seed_seq.spawn_key + (purpose, index))
+        rng = np.random.default_rng(child)
+        return rng if self.antithetic is None else UniformGenerator(rng, self.antithetic)